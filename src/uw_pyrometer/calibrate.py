@@ -0,0 +1,137 @@
+import logging
+import itertools
+import numpy as np
+from uw_pyrometer import pyrometer
+from uw_pyrometer.emissivity import bandpass, to_k
+
+logger = logging.getLogger(__name__)
+
+CHUNK_ROWS = 65536
+ADC_LEVELS = 1024
+GAIN_LEVELS = 256
+RAW_COLUMNS = ('tr_v', 'tp_v', 'ref_v', 'tp_gain', 'tr_gain', 'block_temp')
+R_ZERO_SPAN = 2.0 # Initial search covers r_zero / span to r_zero * span
+CURVE_SCALE_RANGE = (0.7, 1.3)
+GRID_POINTS = 41
+ZOOM_STEPS = 8
+
+
+def radiance(temperature):
+    """Power seen from a blackbody at ``temperature`` in uW."""
+    return 1e6 * pyrometer.RESPONSIVITY * bandpass(temperature) * to_k(temperature)**4
+
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS):
+    """Stream the raw sample columns of a run csv in blocks of rows."""
+    with open(path, encoding='utf8') as f:
+        header = f.readline().strip().split(',')
+        missing = [c for c in RAW_COLUMNS if c not in header]
+        if missing:
+            raise ValueError(f'{path} has no {", ".join(missing)} columns.')
+        names = RAW_COLUMNS + (('flags',) if 'flags' in header else ())
+        columns = [header.index(c) for c in names]
+        while lines := list(itertools.islice(f, chunk_rows)):
+            block = np.loadtxt(lines, delimiter=',', usecols=columns, ndmin=2)
+            if 'flags' in names:
+                block = block[block[:, -1] == 0] # Skip samples from settling gains
+            yield dict(zip(RAW_COLUMNS, block.T))
+
+
+class CalibrationFit:
+    """Least squares fit of a calibration to blackbody samples.
+
+    The thermistor reading is a 10 bit ADC value at an integer gain, so every
+    sample falls in one of 1024 * 256 bins that each give a single
+    temperature for any trial calibration. Accumulating sums per bin keeps
+    the fit exact over every sample while the data streams past once, and
+    trial calibrations are then scored on the bins alone.
+
+    The model is ``V = tp_resp * (e * P(T_block) - P(T_thermistor) + bg)``
+    for thermopile voltage ``V``, where ``P`` is the power from a blackbody.
+    """
+
+    def __init__(self, emissivity=1.0):
+        self.emissivity = emissivity
+        size = ADC_LEVELS * GAIN_LEVELS
+        # Per bin: count, sum x, sum x^2, sum V, sum V x, sum V^2
+        self.sums = np.zeros((6, size))
+
+    @property
+    def samples(self):
+        return int(self.sums[0].sum())
+
+    def add(self, chunk):
+        tr_adc = np.rint(chunk['tr_v'] * ADC_LEVELS / 5).astype(int)
+        bins = tr_adc * GAIN_LEVELS + chunk['tr_gain'].astype(int)
+        x = self.emissivity * radiance(chunk['block_temp'])
+        voltage = chunk['tp_gain'] * (chunk['tp_v'] - chunk['ref_v']) / (255 * 51.)
+        for row, weights in enumerate((None, x, x**2, voltage, voltage*x, voltage**2)):
+            self.sums[row] += np.bincount(bins, weights, minlength=self.sums.shape[1])
+
+    def add_file(self, path):
+        for chunk in read_chunks(path):
+            self.add(chunk)
+
+    def _solve(self, r_zero, curve_scale):
+        """Linear fit for each trial (r_zero, curve_scale), all at once."""
+        used = np.flatnonzero(self.sums[0])
+        tr_adc, gain = np.divmod(used, GAIN_LEVELS)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            resistance = pyrometer.PyrometerSerial.thermistor_resistance(
+                tr_adc * 5 / ADC_LEVELS, gain)
+        valid = np.isfinite(resistance) & (resistance > 0) # Rails carry no reading
+        resistance = resistance[valid]
+        count, s_x, s_xx, s_v, s_vx, s_vv = self.sums[:, used[valid]]
+
+        curve = pyrometer.thermistor_curve()
+        ratio = (resistance / r_zero[:, None])**(1 / curve_scale[:, None])
+        u = radiance(np.interp(ratio, curve[::-1, 1], curve[::-1, 0]))
+
+        # Sums of z = x - u and products, with z the regressor for tp_resp
+        n, sv, svv = count.sum(), s_v.sum(), s_vv.sum()
+        sz = s_x.sum() - u @ count
+        szz = s_xx.sum() - 2 * u @ s_x + u**2 @ count
+        svz = s_vx.sum() - u @ s_v
+        det = n * szz - sz**2
+        tp_resp = (n * svz - sz * sv) / det
+        offset = (sv - tp_resp * sz) / n
+        sse = svv - tp_resp * svz - offset * sv
+        return tp_resp, offset, sse
+
+    def fit(self, start=None, fit_curve_scale=False):
+        """Best calibration, searching around ``start`` by grid refinement."""
+        if self.samples < 3:
+            raise ValueError('Not enough samples to fit.')
+        if start is None:
+            start = pyrometer.default_calibration()
+
+        log_r = np.log(start.r_zero)
+        r_span = np.log(R_ZERO_SPAN)
+        scale, scale_span = start.curve_scale, 0.0
+        if fit_curve_scale:
+            scale = np.mean(CURVE_SCALE_RANGE)
+            scale_span = (CURVE_SCALE_RANGE[1] - CURVE_SCALE_RANGE[0]) / 2
+
+        for step in range(ZOOM_STEPS):
+            r_grid = log_r + np.linspace(-r_span, r_span, GRID_POINTS)
+            s_grid = scale + np.linspace(-scale_span, scale_span,
+                                         GRID_POINTS if fit_curve_scale else 1)
+            r_trial, s_trial = (a.ravel() for a in np.meshgrid(r_grid, s_grid))
+            tp_resp, offset, sse = self._solve(np.exp(r_trial), s_trial)
+            best = np.nanargmin(sse)
+            if step == 0 and r_trial[best] in (r_grid[0], r_grid[-1]):
+                logger.warning('Best r_zero is at the edge of the search range')
+            log_r, scale = r_trial[best], s_trial[best]
+            # Shrink around the best point, keeping a step of margin
+            r_span *= 4 / (GRID_POINTS - 1)
+            scale_span *= 4 / (GRID_POINTS - 1)
+
+        n = self.samples
+        rms = float(np.sqrt(max(sse[best], 0) / (n - 2)))
+        background = float(offset[best] / tp_resp[best])
+        logger.info('Fit %s samples, rms residual %.3g V, background %.1f uW',
+                    n, rms, background)
+        calibration = pyrometer.PyrometerCalibration(float(np.exp(log_r)),
+                                                     float(tp_resp[best]),
+                                                     float(scale))
+        return calibration, {'samples': n, 'rms': rms, 'background': background}
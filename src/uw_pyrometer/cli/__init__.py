@@ -1,12 +1,74 @@
+import os
+import stat
+import contextlib
 import click
-import yaml
-from uw_pyrometer import pyrometer
+from uw_pyrometer import pyrometer, omega_controller, wiretrace
 
 
 class Calibration(click.Path):
+    """A calibration yaml, or a directory of them matched to boards."""
+
     def convert(self, value, param, ctx):
+        import yaml
+
         path = super().convert(value, param, ctx)
+        if os.path.isdir(path):
+            from uw_pyrometer.registry import registry_for
+            return registry_for(os.path.abspath(path))
         try:
             return pyrometer.PyrometerCalibration.from_yaml(path)
         except yaml.YAMLError as exp:
             self.fail(f'Invalid yaml {exp}', param, ctx)
+
+
+trace_option = click.option('--trace', '-t', default=None,
+                            type=click.Path(dir_okay=False, writable=True),
+                            help='Record raw serial traffic to a binary trace file.')
+
+
+def open_trace(path):
+    if path is None:
+        return contextlib.nullcontext()
+    return wiretrace.WireTrace(path)
+
+
+def is_daemon_socket(path):
+    try:
+        return stat.S_ISSOCK(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+def open_pyrometer(serial_path, device_id, calibration=None, trace=None):
+    """Open a board, or talk to the daemon if given its socket."""
+    if is_daemon_socket(serial_path):
+        from uw_pyrometer import daemon
+
+        client = daemon.DaemonClient(serial_path)
+        return daemon.RemotePyrometer(client, device_id, calibration)
+    return pyrometer.PyrometerSerial(device_id, serial_path, calibration, trace)
+
+
+def open_pyrometers(serial_path, device_ids, calibration=None, trace=None):
+    """Open several boards on one port, sharing one I/O worker."""
+    if len(device_ids) == 1 or is_daemon_socket(serial_path):
+        return [open_pyrometer(serial_path, i, calibration, trace) for i in device_ids]
+    import serial
+    from uw_pyrometer.portpool import PortWorker
+
+    port = serial.Serial(serial_path, **pyrometer.PyrometerSerial.serial_kw_args)
+    worker = PortWorker(serial_path)
+    boards = []
+    for device_id in device_ids:
+        board = pyrometer.PyrometerSerial(device_id, port, calibration, trace)
+        board.worker = worker
+        boards.append(board)
+    return boards
+
+
+def open_controller(serial_path, trace=None):
+    if is_daemon_socket(serial_path):
+        from uw_pyrometer import daemon
+
+        return daemon.RemoteController(daemon.DaemonClient(serial_path))
+    return omega_controller.omega_pid(port=serial_path, trace=trace)
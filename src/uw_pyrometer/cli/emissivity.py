@@ -1,10 +1,13 @@
+import os
+import sys
+import csv
+import glob
 import logging
+import contextlib
 import click
-#import matplotlib
-#matplotlib.use('TkAgg')
-import matplotlib.pyplot as plt
+import numpy as np
 
-from uw_pyrometer import emissivity, pyrometer, omega_controller, cli
+from uw_pyrometer import emissivity, pyrometer, omega_controller, replay, planner, cli
 from uw_pyrometer.__about__ import __version__
 
 logger = logging.getLogger(__name__)
@@ -20,21 +23,22 @@ def emissivity_routine():
 @click.option('--output', '-o', default=None, type=click.Path(exists=False),
               help='Output figure path.')
 def plot(data_path, output):
-    with open(data_path, encoding='utf8') as f:
-        header = f.readline().strip().split(',')
-        data = {k: [] for k in header}
-        for row in f.readlines():
-            for k, v in zip(header, row.strip().split(',')):
-                data[k].append(float(v))
+    #import matplotlib
+    #matplotlib.use('TkAgg')
+    import matplotlib.pyplot as plt
+    from uw_pyrometer.vis import EmissivityVis
+
+    data = emissivity.read_csv(data_path)
 
     plt.style.use(emissivity.PLOT_STYLE)
-    vis = emissivity.EmissivityVis()
+    vis = EmissivityVis()
     t_lim = (min(data['block_temp'])-10, max(data['block_temp'])+10)
     vis.set_txlim(*t_lim)
-    e, bg = emissivity.analyze_emissivity(data, vis)
+    e, bg, cov = emissivity.analyze_emissivity(data, vis)
     # vis.ax.set_ylim([1e6*bg+e*x for x in vis.ax.get_xlim()])
-    print('Emissivity:', f'{e:.3f}')
-    print('Background:', f'{1e6*bg:.1f} uW')
+    e_err, bg_err = np.sqrt(np.diag(cov))
+    print('Emissivity:', f'{e:.3f} +/- {e_err:.3f}')
+    print('Background:', f'{1e6*bg:.1f} +/- {1e6*bg_err:.1f} uW')
 
     if output is None:
         plt.figure().canvas.manager.canvas.figure = vis
@@ -43,25 +47,160 @@ def plot(data_path, output):
         vis.savefig(output)
 
 
+BATCH_COLUMNS = ('path', 'points', 'samples', 'emissivity', 'emissivity_err',
+                 'background', 'background_err', 'error', 'figure_error')
+
+
+def find_runs(paths):
+    """Expand directories and glob patterns into csv files, in order."""
+    runs = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = glob.glob(os.path.join(path, '**', '*.csv'), recursive=True)
+        else:
+            matches = glob.glob(path, recursive=True)
+            if not matches:
+                raise click.BadParameter(f'No files match {path}.', param_hint='PATHS')
+        runs.extend(sorted(matches))
+    return list(dict.fromkeys(runs)) # Drop repeats
+
+
+@emissivity_routine.command()
+@click.argument('paths', nargs=-1, required=True)
+@click.option('--output', '-o', default=None, type=click.Path(dir_okay=False),
+              help='Summary csv path. Printed if not given.')
+@click.option('--figures', '-f', default=None, type=click.Path(file_okay=False),
+              help='Save a figure for each run in this directory.')
+@click.option('--jobs', '-j', default=None, type=click.IntRange(min=1),
+              help='Worker processes. Defaults to the number of cores.')
+def batch(paths, output, figures, jobs):
+    """Reanalyze every run csv in PATHS (files, directories or globs)."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    runs = find_runs(paths)
+    figure_paths = [None] * len(runs)
+    if figures is not None:
+        os.makedirs(figures, exist_ok=True)
+        # Runs in different directories often share a file name
+        figure_paths = [os.path.join(figures, os.path.splitext(
+                            os.path.normpath(run).strip(os.sep).replace(os.sep, '_'))[0] + '.pdf')
+                        for run in runs]
+
+    with ProcessPoolExecutor(jobs) as pool:
+        chunksize = max(1, len(runs) // (4 * (jobs or os.cpu_count() or 1)))
+        results = list(pool.map(emissivity.reanalyze, runs, figure_paths,
+                                chunksize=chunksize))
+
+    with (open(output, 'w', encoding='utf8') if output else contextlib.nullcontext(sys.stdout)) as f:
+        writer = csv.writer(f)
+        writer.writerow(BATCH_COLUMNS)
+        for result in results:
+            writer.writerow([f'{x:.4g}' if isinstance(x, float) else x
+                             for x in (result.get(k, '') for k in BATCH_COLUMNS)])
+
+    failed = [r for r in results if 'error' in r]
+    for result in failed:
+        logger.warning('%s: %s', result['path'], result['error'])
+    if failed:
+        click.echo(f'{len(failed)} of {len(results)} runs failed.', err=True)
+    no_figure = [r for r in results if 'figure_error' in r]
+    for result in no_figure:
+        logger.warning('%s figure: %s', result['path'], result['figure_error'])
+    if no_figure:
+        click.echo(f'{len(no_figure)} of {len(results)} figures failed.', err=True)
+
+
+@emissivity_routine.command()
+@click.argument('paths', nargs=-1, required=True)
+@click.option('--output', '-o', required=True, type=click.Path(dir_okay=False),
+              help='Path for the new calibration yaml.')
+@click.option('--calibration', '-c', default=None, type=cli.Calibration(dir_okay=False),
+              help='Calibration to start the search from.')
+@click.option('--emissivity', '-e', 'source_emissivity', default=1.0,
+              type=click.FloatRange(0, 1, min_open=True),
+              help='Emissivity of the blackbody source.')
+@click.option('--curve-scale', default=False, is_flag=True,
+              help='Also fit a scale on the thermistor curve.')
+@click.option('--device_id', '-d', default=None, type=click.IntRange(0, 254),
+              help='Board the calibration is for, recorded in the yaml.')
+def calibrate(paths, output, calibration, source_emissivity, curve_scale, device_id):
+    """Fit r_zero and responsivity from blackbody runs in PATHS."""
+    from uw_pyrometer import calibrate as calibrate_fit
+
+    fit = calibrate_fit.CalibrationFit(source_emissivity)
+    for path in find_runs(paths):
+        logger.info('Reading %s', path)
+        try:
+            fit.add_file(path)
+        except ValueError as exp:
+            raise click.ClickException(str(exp)) from exp
+
+    try:
+        result, info = fit.fit(calibration, curve_scale)
+    except ValueError as exp:
+        raise click.ClickException(str(exp)) from exp
+    result.to_yaml(output, device_id)
+    print('Thermistor R0:', f'{result.r_zero:.1f} Ohm')
+    if curve_scale:
+        print('Curve scale:', f'{result.curve_scale:.4f}')
+    print('Responsivity:', f'{result.tp_resp:.4e} V/uW')
+    print('Background:', f'{info["background"]:.1f} uW')
+    print('Residual:', f'{1e6*info["rms"]:.2f} uV rms over {info["samples"]} samples')
+
+
+def write_heater_log(path, history):
+    new = not os.path.exists(path)
+    with open(path, 'a', encoding='utf8') as f:
+        if new:
+            f.write(','.join(planner.HISTORY_COLUMNS) + '\n')
+        for row in history:
+            f.write(','.join(f'{x:.3f}' for x in row) + '\n')
+
+
 @emissivity_routine.command()
 @click.argument('tp_serial', type=str)
 @click.argument('temp_serial', type=str)
 @click.argument('temps', type=float, nargs=-1)
-@click.option('--device_id', '-d', default=0, type=click.IntRange(0, 254))
+@click.option('--device_id', '-d', 'device_ids', default=[0], multiple=True,
+              type=click.IntRange(0, 254),
+              help='Board id. Repeat for several boards on the port, each '
+              'writing its own csv with the id added to the output name.')
 @click.option('--calibration', '-c', default=None, type=cli.Calibration(),
-              help='Path to a yaml calibration file.')
-@click.option('--samples', '-n', default=None, type=click.IntRange(min=0),
-              help='Number of samples to collect. 0 runs indefinitely. If not'
-              'provided, sample the number of points to average.')
+              help='Path to a yaml calibration file, or a directory of them.')
+@click.option('--samples', '-n', default=None, type=click.IntRange(min=1),
+              help='Most samples to collect at each temperature. Needed unless '
+              '--power-sem or --temp-sem ends sampling.')
 @click.option('--interval', '-i', default=1.0, type=click.FloatRange(min_open=0),
               help='Polling interval in seconds.')
 @click.option('--plot', '-p', default=False, is_flag=True)
 @click.option('--output', '-o', default=None, type=click.Path(exists=False),
               help='Output csv path.')
+@click.option('--power-sem', default=None, type=click.FloatRange(min_open=0),
+              help='Stop sampling a set point once the standard error of the '
+              'mean power is below this (uW). --samples is then the most taken.')
+@click.option('--temp-sem', default=None, type=click.FloatRange(min_open=0),
+              help='Stop once the standard error of the mean thermistor '
+              'temperature is below this (C), with --power-sem if given.')
+@click.option('--track-gains', default=False, is_flag=True,
+              help='Adjust gains while sampling if readings near the ADC limits.')
+@click.option('--heater-log', default=None, type=click.Path(dir_okay=False),
+              help='Csv of block temperature readings. The heater model is '
+              'fitted from it, and this run is appended to it.')
+@click.option('--plan', 'reorder', default=False, is_flag=True,
+              help='Reorder the temperatures for the shortest predicted run.')
+@click.option('--warmup', default=None, nargs=2, type=float, metavar='TEMP SECONDS',
+              help='Soak at TEMP for SECONDS before the first set point.')
+@click.option('--checkpoint', default=None, type=click.Path(dir_okay=False),
+              help='Save progress here after every set point. '
+              'Defaults to the output path with .checkpoint.json added.')
+@click.option('--resume', default=False, is_flag=True,
+              help='Continue from the checkpoint, skipping completed set points.')
 @click.option('--verbose', '-v', default=False, is_flag=True)
 @click.option('--log', '-l', default=False, is_flag=True)
-def read(tp_serial, temp_serial, temps, device_id,
-         calibration, samples, interval, plot, output, verbose, log):
+@cli.trace_option
+def read(tp_serial, temp_serial, temps, device_ids,
+         calibration, samples, interval, plot, output, power_sem, temp_sem,
+         track_gains, heater_log, reorder, warmup, checkpoint, resume, verbose, log, trace):
     # Setup log
     debug = verbose or log
     pyrometer.logger.setLevel('DEBUG' if debug else 'WARNING')
@@ -76,9 +215,105 @@ def read(tp_serial, temp_serial, temps, device_id,
     emissivity.logger.addHandler(handler)
     logger.info('Starting for temps: %s', temps)
 
-    tp_dev = pyrometer.PyrometerSerial(device_id, tp_serial, calibration)
-    temp_dev = omega_controller.omega_pid(port=temp_serial)
-    emissivity.run(tp_dev, temp_dev, temps, samples, interval, plot, output)
+    precision = {k: v for k, v in (('power', power_sem), ('temp', temp_sem))
+                 if v is not None}
+    if samples is None and not precision:
+        raise click.UsageError('Give --samples, or --power-sem or --temp-sem to end sampling.')
+
+    if checkpoint is None and output is not None:
+        checkpoint = f'{output}.checkpoint.json'
+    resume_state = None
+    if resume:
+        if checkpoint is None or not os.path.exists(checkpoint):
+            raise click.UsageError('--resume needs an existing checkpoint.')
+        try:
+            resume_state = emissivity.load_checkpoint(checkpoint)
+        except (OSError, ValueError) as exp:
+            raise click.ClickException(f'Could not read checkpoint: {exp}')
+        temps = emissivity.remaining_temps(temps, resume_state)
+        warmup = None # The block is already in use
+
+    model = planner.HeaterModel()
+    if heater_log is not None and os.path.exists(heater_log):
+        model = planner.HeaterModel.from_history(heater_log)
+        logger.info('Heater model %s', model)
+
+    with cli.open_trace(trace) as tracer:
+        if len(set(device_ids)) < len(device_ids):
+            raise click.UsageError('A board id is given more than once.')
+        tp_dev = cli.open_pyrometers(tp_serial, device_ids, calibration, tracer)
+        if len(tp_dev) == 1:
+            tp_dev = tp_dev[0]
+        temp_dev = cli.open_controller(temp_serial, tracer)
+        start = temp_dev.val()
+        dwell = samples * interval if samples else 0.0
+        if reorder:
+            temps, predicted = planner.plan(temps, model, start, dwell, warmup)
+            print('Planned order:', ', '.join(f'{t:g}' for t in temps))
+        else:
+            predicted = planner.predicted_time(temps, model, start, dwell, warmup)
+        print(f'Predicted run time: {predicted / 3600:.1f} h')
+        if tracer is not None:
+            tracer.note({'temps': list(temps), 'device_ids': list(device_ids),
+                         'samples': samples, 'interval': interval,
+                         'precision': precision, 'track_gains': track_gains,
+                         'warmup': warmup,
+                         'completed': (resume_state or {}).get('completed')})
+
+        history = []
+        try:
+            if warmup is not None:
+                emissivity.warm_up(temp_dev, *warmup, heater_log=history)
+            emissivity.run(tp_dev, temp_dev, temps, samples, interval, plot, output,
+                           precision=precision, heater_log=history,
+                           checkpoint=checkpoint, resume=resume_state,
+                           track_gains=track_gains)
+        finally:
+            if heater_log is not None:
+                write_heater_log(heater_log, history)
+
+
+@emissivity_routine.command(name='replay')
+@click.argument('trace_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--calibration', '-c', default=None, type=cli.Calibration(),
+              help='Path to a yaml calibration file, or a directory of them.')
+@click.option('--speed', '-s', default=None, type=click.FloatRange(min_open=0),
+              help='Replay this many times faster than real time. '
+              'By default replay as fast as possible.')
+@click.option('--plot', '-p', default=False, is_flag=True)
+@click.option('--output', '-o', default=None, type=click.Path(exists=False),
+              help='Output csv path.')
+def replay_run(trace_path, calibration, speed, plot, output):
+    """Rerun a traced emissivity routine from its serial capture."""
+    session = replay.ReplaySession(trace_path, speed)
+    settings = session.metadata
+    if 'temps' not in settings:
+        raise click.ClickException('Trace has no emissivity routine settings.')
+
+    device_ids = settings.get('device_ids', [settings.get('device_id')])
+    tp_dev = [replay.replay_pyrometer(session, i, calibration) for i in device_ids]
+    if len(tp_dev) == 1:
+        tp_dev = tp_dev[0]
+    else:
+        from uw_pyrometer.portpool import PortWorker
+
+        worker = PortWorker('replay') # Shared, as the recorded boards were
+        for board in tp_dev:
+            board.worker = worker
+    temp_dev = replay.replay_controller(session)
+    if 'warmup' in settings:
+        temp_dev.val() # The starting temperature read for planning
+    if settings.get('warmup') is not None:
+        emissivity.warm_up(temp_dev, *settings['warmup'], clock=session)
+    # A resumed run is replayed from its cached gains; earlier set points
+    # aren't in the trace
+    resume = None
+    if settings.get('completed'):
+        resume = {'completed': settings['completed']}
+    emissivity.run(tp_dev, temp_dev, settings['temps'], settings['samples'],
+                   settings['interval'], plot, output, clock=session,
+                   precision=settings.get('precision'), resume=resume,
+                   track_gains=settings.get('track_gains', False))
 
 
 @emissivity_routine.command()
@@ -1,8 +1,9 @@
-import time
+import os
 import logging
-import asyncio
 import click
-from uw_pyrometer import pyrometer, cli
+from uw_pyrometer import pyrometer, wiretrace, cli
+from uw_pyrometer.stats import RollingStats
+from uw_pyrometer.scheduler import FixedRateScheduler
 from uw_pyrometer.__about__ import __version__
 
 logger = logging.getLogger(__name__)
@@ -13,23 +14,42 @@ FORMAT_UNITS = {'temp': 'Temperature:{:>9.1f} C',
                 'tp_v': 'Thermopile V:{:>8.1f} uV'}
 
 
-def print_physical(measurements, average, voltage, show_prelim, clear):
-    samples_taken = len(measurements['tp_v'])
-    if (samples_taken < average) and not show_prelim:
-        return
+def parse_filters(ctx, param, value):
+    from uw_pyrometer import filters
 
-    separator = '*:' if samples_taken < average else ':'
+    for spec in value:
+        try:
+            filters.parse_stage(spec)
+        except ValueError as exp:
+            raise click.BadParameter(str(exp)) from None
+    return value
+
+
+def window_stats(keys, average, median):
+    return {key: RollingStats(average, median) for key in keys}
+
+
+def format_spread(stats, scale=lambda x: x):
+    return (f'  sd {scale(stats.std):.3g} '
+            f'[{scale(stats.min):.4g}, {scale(stats.max):.4g}]')
 
-    if clear:
-        click.clear()
-    else:
-        click.echo()
 
+def physical_lines(stats, average, voltage, show_prelim, spread=False, median=False):
     to_show = ['tr_v', 'tp_v'] if voltage else ['temp', 'power']
+    samples_taken = len(stats[to_show[-1]])
+    if (samples_taken < average) and not show_prelim:
+        return []
+
+    separator = '*:' if samples_taken < average else ':'
+
+    lines = []
     for key in to_show:
-        quantity = sum(measurements[key])/len(measurements[key])
+        quantity = stats[key].median if median else stats[key].mean
         quantity_str = FORMAT_UNITS[key].format(quantity)
-        click.echo(f'{key+separator:<13} {quantity_str}')
+        if spread:
+            quantity_str += format_spread(stats[key])
+        lines.append(f'{key+separator:<13} {quantity_str}')
+    return lines
 
 
 
@@ -48,16 +68,21 @@ def uw_pyrometer():
 @click.option('--interval', '-i', default=1.0, type=click.FloatRange(min_open=0),
               help='Polling interval in seconds.')
 @click.option('--samples', '-n', default=None, type=click.IntRange(min=0),
-              help='Number of samples to collect. 0 runs indefinitely. If not'
-              'provided, sample the number of points to average.')
+              help='Number of samples to collect. 0 runs until interrupted with '
+              'Ctrl-C. If not provided, sample the number of points to average.')
 @click.option('--average', '-a', default=1, type=click.IntRange(min=1),
               help='Set number of points to average over.')
 @click.option('--show_prelim', default=False, is_flag=True,
               help='Show values before average samples are collected.')
 @click.option('--no_clear', default=False, is_flag=True,
-              help='Leave old samples instead of clearing console.')
+              help='Append each update instead of redrawing in place.')
+@click.option('--spread', default=False, is_flag=True,
+              help='Also show standard deviation, min and max over the average.')
+@click.option('--median', default=False, is_flag=True,
+              help='Show the median over the average instead of the mean.')
+@cli.trace_option
 def measure_adc(serial_path, device_id, verbose, broadcast, interval,
-                samples, average, show_prelim, no_clear):
+                samples, average, show_prelim, no_clear, spread, median, trace):
     """Report the voltage for thermopile, thermistor, and ref at the ADC."""
     if verbose:
         pyrometer.logger.setLevel('DEBUG')
@@ -72,39 +97,52 @@ def measure_adc(serial_path, device_id, verbose, broadcast, interval,
     if (average > samples) and (samples > 0):
         logger.warning('%s samples not enough for %s point averaging', samples, average)
 
-    device = pyrometer.PyrometerSerial(device_id, serial_path)
+    with cli.open_trace(trace) as tracer:
+        device = cli.open_pyrometer(serial_path, device_id, trace=tracer)
+        report_adc(device, broadcast, interval, samples, average,
+                   show_prelim, no_clear, verbose, spread, median)
+
+
+def report_adc(device, broadcast, interval, samples, average,
+               show_prelim, no_clear, verbose, spread, median):
+    from uw_pyrometer.display import LiveDisplay
+
     samples_taken = 0
-    samples_history = {'Reference': [], 'Thermistor': [], 'Thermopile': []}
-    while (samples_taken < samples) or (samples == 0):
-        if samples_taken > 0:
-            time.sleep(interval)
-        try:
-            ref, tr, tp = device.get_measurement(broadcast=broadcast)
-        except TimeoutError:
-            click.echo('Read timed out.')
-            continue
-
-        samples_history['Reference'].append(ref)
-        samples_history['Thermistor'].append(tr)
-        samples_history['Thermopile'].append(tp)
-        samples_history.update({key: value[-average:]
-                                for key, value in samples_history.items()})
-        logger.debug(samples_history)
-        samples_taken += 1
-
-        if (samples_taken >= average) or show_prelim:
-            separator = '*:' if samples_taken < average else ':'
-
-            if average != (1 if show_prelim else samples) and not verbose:
-                # If more than one value is displayed
-                if no_clear:
-                    click.echo()
-                else:
-                    click.clear()
-
-            for key, value in samples_history.items():
-                voltage = device.adc_to_voltage(sum(value)/len(value))
-                click.echo(f'{key+separator:<13}{voltage:1.2f} V')
+    samples_stats = window_stats(['Reference', 'Thermistor', 'Thermopile'],
+                                 average, median)
+
+    def render():
+        if (samples_taken < average) and not show_prelim:
+            return []
+        separator = '*:' if samples_taken < average else ':'
+        lines = []
+        for key, stats in samples_stats.items():
+            voltage = device.adc_to_voltage(stats.median if median else stats.mean)
+            line = f'{key+separator:<13}{voltage:1.2f} V'
+            if spread:
+                line += format_spread(stats, device.adc_to_voltage)
+            lines.append(line)
+        return lines
+
+    # Redraw in place only if more than one value is displayed
+    in_place = average != (1 if show_prelim else samples) and not (no_clear or verbose)
+    scheduler = FixedRateScheduler(interval)
+    with LiveDisplay(render, in_place=in_place) as display:
+        while (samples_taken < samples) or (samples == 0):
+            scheduler.wait_sync()
+            try:
+                ref, tr, tp = device.get_measurement(broadcast=broadcast)
+            except TimeoutError:
+                display.echo('Read timed out.')
+                continue
+
+            with display.lock:
+                samples_stats['Reference'].add(ref)
+                samples_stats['Thermistor'].add(tr)
+                samples_stats['Thermopile'].add(tp)
+                samples_taken += 1
+            logger.debug('ADC codes: ref %s; tr %s; tp %s', ref, tr, tp)
+            display.refresh()
 
 
 @uw_pyrometer.command()
@@ -115,7 +153,8 @@ def measure_adc(serial_path, device_id, verbose, broadcast, interval,
 @click.option('--verbose', '-v', default=False, is_flag=True)
 @click.option('--broadcast', '-b', default=False, is_flag=True,
               help='Send commands to all device ids.')
-def gain(serial_path, thermopile, thermistor, device_id, verbose, broadcast):
+@cli.trace_option
+def gain(serial_path, thermopile, thermistor, device_id, verbose, broadcast, trace):
     """Set the gain by changing the amplifier feedback potentiometer."""
     if verbose:
         pyrometer.logger.setLevel('DEBUG')
@@ -123,42 +162,95 @@ def gain(serial_path, thermopile, thermistor, device_id, verbose, broadcast):
         logger.setLevel('DEBUG')
         logger.addHandler(logging.StreamHandler())
 
-    device = pyrometer.PyrometerSerial(device_id, serial_path)
-    device.set_gains(thermopile, thermistor, broadcast)
+    with cli.open_trace(trace) as tracer:
+        device = cli.open_pyrometer(serial_path, device_id, trace=tracer)
+        device.set_gains(thermopile, thermistor, broadcast)
+
+
+@uw_pyrometer.command(name='auto-gain')
+@click.argument('serial_path', type=str)
+@click.option('--device_id', '-d', 'device_ids', default=[0], multiple=True,
+              type=click.IntRange(0, 254), help='Board id. Repeat for each board.')
+@click.option('--broadcast', '-b', default=False, is_flag=True,
+              help='The boards are the whole bus, so gains they share can be broadcast.')
+@click.option('--verbose', '-v', default=False, is_flag=True)
+@cli.trace_option
+def auto_gain(serial_path, device_ids, broadcast, verbose, trace):
+    """Find gains for boards on one port, settling them together."""
+    if verbose:
+        pyrometer.logger.setLevel('DEBUG')
+        pyrometer.logger.addHandler(logging.StreamHandler())
+
+    with cli.open_trace(trace) as tracer:
+        boards = cli.open_pyrometers(serial_path, device_ids, trace=tracer)
+        if cli.is_daemon_socket(serial_path):
+            gains = [board.auto_gain() for board in boards]
+        else:
+            gains = pyrometer.fleet_auto_gain(boards, broadcast=broadcast)
+    for board, (tp_gain, tr_gain) in zip(boards, gains):
+        print(f'Board {board.id}: thermopile {tp_gain}, thermistor {tr_gain}')
 
 
 @uw_pyrometer.command()
 @click.argument('serial_path', type=str)
 @click.option('--device_id', '-d', default=0, type=click.IntRange(0, 254))
 @click.option('--calibration', '-c', default=None, type=cli.Calibration(),
-              help='Path to a yaml calibration file.')
+              help='Path to a yaml calibration file, or a directory of them.')
 @click.option('--gains', '-g', default=None, nargs=2, type=click.IntRange(0, 255),
               help='See gain command.')
 @click.option('--verbose', '-v', default=False, is_flag=True)
 @click.option('--interval', '-i', default=1.0, type=click.FloatRange(min_open=0),
               help='Polling interval in seconds.')
 @click.option('--samples', '-n', default=None, type=click.IntRange(min=0),
-              help='Number of samples to collect. 0 runs indefinitely. If not'
-              'provided, sample the number of points to average.')
+              help='Number of samples to collect. 0 runs until interrupted with '
+              'Ctrl-C. If not provided, sample the number of points to average.')
 @click.option('--average', '-a', default=1, type=click.IntRange(min=1),
               help='Set number of points to average over.')
 @click.option('--show_prelim', default=False, is_flag=True,
               help='Show values before average samples are collected.')
 @click.option('--no_clear', default=False, is_flag=True,
-              help='Leave old samples instead of clearing console.')
+              help='Append each update instead of redrawing in place.')
+@click.option('--spread', default=False, is_flag=True,
+              help='Also show standard deviation, min and max over the average.')
+@click.option('--median', default=False, is_flag=True,
+              help='Show the median over the average instead of the mean.')
 @click.option('--voltage', '-V', default=False, is_flag=True,
               help='Show the thermopile preamplifier voltage instead of power.')
+@click.option('--ring', default=None, type=str,
+              help='Publish samples to a shared memory ring with this name.')
+@click.option('--filter', '-f', 'filter_specs', multiple=True, callback=parse_filters,
+              help='Filter stage applied before averaging, in order given: '
+              'boxcar:N, cic:N[:ORDER], median[:WINDOW[:THRESHOLD]] or '
+              'kalman[:PROCESS_VAR[:MEASUREMENT_VAR]].')
+@click.option('--track-gains', default=False, is_flag=True,
+              help='Adjust gains while sampling if readings near the ADC limits.')
+@cli.trace_option
 def measure_physical(serial_path, device_id, calibration, gains,
                      verbose, interval, samples, average,
-                     show_prelim, no_clear, voltage):
+                     show_prelim, no_clear, spread, median, voltage, ring, filter_specs,
+                     track_gains, trace):
     """Report the thermistor temperature and thermopile power."""
     pyrometer.logger.setLevel('DEBUG' if verbose else 'WARNING')
     logger.setLevel('DEBUG' if verbose else 'WARNING')
     logger.addHandler(logging.StreamHandler())
     pyrometer.logger.addHandler(logging.StreamHandler())
 
-    device = pyrometer.PyrometerSerial(device_id, serial_path, calibration)
-    if gains is None:
+    with cli.open_trace(trace) as tracer:
+        device = cli.open_pyrometer(serial_path, device_id, calibration, tracer)
+        report_physical(device, gains, interval, samples, average,
+                        show_prelim, no_clear, voltage, spread, median, ring,
+                        filter_specs, track_gains)
+
+
+def report_physical(device, gains, interval, samples, average,
+                    show_prelim, no_clear, voltage, spread, median, ring_name=None,
+                    filter_specs=(), track_gains=False):
+    import asyncio
+
+    if gains is None and device.pot_thermopile is not None:
+        # A daemon's board keeps the gains it holds for its other clients
+        print('Gains:', (device.pot_thermopile, device.pot_thermistor))
+    elif gains is None:
         click.echo('Auto gain')
         gains = device.auto_gain()
         print('Gains:', gains)
@@ -172,9 +264,160 @@ def measure_physical(serial_path, device_id, calibration, gains,
     if (average > samples) and (samples > 0):
         logger.warning('%s too few samples for %s average', samples, average)
 
-    clear = not (no_clear or samples == average)
+    in_place = not (no_clear or samples == average)
+
+    from uw_pyrometer import filters
+    from uw_pyrometer.display import LiveDisplay
+
+    to_show = ['tr_v', 'tp_v'] if voltage else ['temp', 'power']
+    stats = window_stats(to_show, average, median)
+    # Each shown quantity gets its own stages, as filters keep state. With
+    # no stages the samples pass through unchanged.
+    pipelines = {key: filters.Pipeline(*[filters.parse_stage(f) for f in filter_specs])
+                 for key in to_show}
+    display = LiveDisplay(lambda: physical_lines(stats, average, voltage, show_prelim,
+                                                 spread, median),
+                          in_place=in_place)
+    settling = False
+
+    def update_settling(m):
+        nonlocal settling
+        if m['flags'] & pyrometer.FLAG_SETTLING:
+            if not settling:
+                display.echo(f'Gains ({m["tp_gain"]}, {m["tr_gain"]}) settling')
+            settling = True
+        else:
+            settling = False
+
+    def update_stats(block):
+        if not any(len(values) for values in block.values()):
+            return # A decimating filter is still collecting
+        with display.lock:
+            for key, values in block.items():
+                stats[key].extend(values)
+        display.refresh()
+
+    ring = None
+    if ring_name is not None:
+        from uw_pyrometer.shmring import SampleRing
+        ring = SampleRing.create(ring_name)
+    try:
+        with display:
+            # Filter the samples arriving between redraws together
+            block = max(1, round(display.period / interval))
+            asyncio.run(device.sample(samples or None, interval, updater_f=update_settling,
+                                      ring=ring, filters=pipelines, filter_block=block,
+                                      filtered_f=update_stats, track_gains=track_gains))
+    finally:
+        if ring is not None:
+            ring.close()
+
+
+@uw_pyrometer.command()
+@click.argument('socket_path', type=click.Path(dir_okay=False))
+@click.option('--board', 'boards', multiple=True, type=(str, click.IntRange(0, 254)),
+              help='Serial port and device id of a board. Repeat for each board.')
+@click.option('--controller', default=None, type=str,
+              help='Serial port of an Omega temperature controller.')
+@click.option('--calibration', '-c', default=None, type=cli.Calibration(),
+              help='Path to a yaml calibration file, or a directory of them.')
+@click.option('--verbose', '-v', default=False, is_flag=True)
+def daemon(socket_path, boards, controller, calibration, verbose):
+    """Own the serial ports and serve them to commands given SOCKET_PATH."""
+    import asyncio
+    from uw_pyrometer import daemon as acquisition
+
+    for log in (logger, pyrometer.logger, acquisition.logger):
+        log.setLevel('DEBUG' if verbose else 'INFO')
+        log.addHandler(logging.StreamHandler())
+
+    if cli.is_daemon_socket(socket_path):
+        os.unlink(socket_path) # Left by a daemon that did not exit cleanly
 
-    def update_printer(m):
-        return print_physical(m, average, voltage, show_prelim, clear)
+    async def serve():
+        server = acquisition.AcquisitionDaemon(boards, controller, calibration)
+        await server.serve(socket_path)
 
-    asyncio.run(device.sample(samples, interval, updater_f=update_printer))
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if cli.is_daemon_socket(socket_path):
+            os.unlink(socket_path)
+
+
+@uw_pyrometer.command()
+@click.argument('ring_name', type=str)
+@click.option('--interval', '-i', default=0.5, type=click.FloatRange(min_open=0),
+              help='Polling interval in seconds.')
+def ring_tail(ring_name, interval):
+    """Print samples published to a shared memory ring."""
+    from uw_pyrometer.shmring import SampleRing, RingReader
+
+    ring = SampleRing.attach(ring_name)
+    reader = RingReader(ring)
+    scheduler = FixedRateScheduler(interval)
+    lost = 0
+    try:
+        while True:
+            scheduler.wait_sync()
+            for record in reader.poll():
+                click.echo(f'{record["seq"]:>8} {record["time"]:12.3f} '
+                           f'board {record["board"]:3d} {record["temp"]:7.2f} C '
+                           f'{record["power"]:9.2f} uW')
+            if reader.lost != lost:
+                click.echo(f'Overrun: {reader.lost - lost} samples lost', err=True)
+                lost = reader.lost
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+
+
+@uw_pyrometer.command()
+@click.argument('ports', nargs=-1, type=str)
+@click.option('--ids', default=None, nargs=2, type=click.IntRange(0, 254),
+              metavar='FIRST LAST', help='Only probe this range of device ids.')
+@click.option('--window', default=None, type=click.IntRange(1, 255),
+              help='Probes sent back to back before waiting for replies.')
+@click.option('--latency', default=None, type=click.FloatRange(min_open=0),
+              help='Seconds to wait for a board to answer, beyond the wire time.')
+def discover(ports, ids, window, latency):
+    """Find the boards on PORTS, or on every serial port.
+
+    A daemon socket lists the boards the daemon owns, with their gains.
+    """
+    from uw_pyrometer import discover as discovery
+
+    ports = ports or discovery.serial_ports()
+    kwargs = {k: v for k, v in (('window', window), ('latency', latency)) if v is not None}
+    if ids is not None:
+        kwargs['device_ids'] = range(ids[0], ids[1] + 1)
+    devices, skipped = discovery.discover([p for p in ports if not cli.is_daemon_socket(p)],
+                                          **kwargs)
+    for path in filter(cli.is_daemon_socket, ports):
+        devices.extend(discovery.daemon_devices(path))
+
+    if not devices:
+        click.echo('No boards found.')
+    for device in devices:
+        gains = '' if device['gains'] is None else ' gains {} {}'.format(*device['gains'])
+        state = '' if device['responding'] else ' not responding'
+        click.echo(f'{device["port"]} id {device["id"]}{gains}{state}')
+    for path, reason in skipped.items():
+        click.echo(f'{path} skipped: {reason}', err=True)
+
+
+@uw_pyrometer.command()
+@click.argument('trace_path', type=click.Path(exists=True, dir_okay=False))
+def trace_dump(trace_path):
+    """Print the contents of a binary serial trace."""
+    direction_names = {wiretrace.TX: 'TX', wiretrace.RX: 'RX', wiretrace.NOTE: '##'}
+    for timestamp, channel, direction, data in wiretrace.read_trace(trace_path):
+        if direction == wiretrace.NOTE:
+            content = data.decode('utf8')
+        else:
+            content = data.hex(' ').upper()
+        click.echo(f'{timestamp:12.6f} {channel:3d} '
+                   f'{direction_names.get(direction, "??")} {content}')
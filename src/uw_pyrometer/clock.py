@@ -0,0 +1,19 @@
+import time
+
+
+class SystemClock:
+    """Wall time for live hardware. Replays substitute a virtual clock."""
+
+    def time(self):
+        return time.monotonic()
+
+    def sleep(self, delay):
+        time.sleep(delay)
+
+    async def async_sleep(self, delay):
+        import asyncio
+
+        await asyncio.sleep(delay)
+
+
+SYSTEM_CLOCK = SystemClock()
@@ -0,0 +1,192 @@
+import json
+import socket
+import asyncio
+import logging
+from uw_pyrometer import pyrometer, omega_controller, portpool
+from uw_pyrometer.link import LinkDown
+
+logger = logging.getLogger(__name__)
+
+CONTROLLER_METHODS = ('val', 'sp', 'restart', 'standby')
+
+
+class DaemonError(RuntimeError):
+    pass
+
+
+class AcquisitionDaemon:
+    """Own the serial ports and serve them to local clients.
+
+    Requests and replies are single JSON lines over a Unix socket. Each port
+    has its own I/O worker, so clients can share a bus without interleaving
+    frames, ports don't wait on each other, and gains persist between
+    clients.
+    """
+
+    def __init__(self, boards, controller=None, calibration=None):
+        # boards: iterable of (port path, device id)
+        self.pool = portpool.PortPool()
+        for path, device_id in boards:
+            self.pool.add_board(path, device_id, calibration)
+
+        self.controller = None
+        if controller is not None:
+            self.controller = omega_controller.omega_pid(port=controller)
+            self.controller_worker = portpool.PortWorker('controller')
+
+    def board(self, request):
+        try:
+            return self.pool.board(request['board'])
+        except KeyError:
+            raise DaemonError(f'No board {request.get("board")}.') from None
+
+    @staticmethod
+    def board_state(board):
+        settle = board.settle_until - board.clock.time() if board.settling else 0.0
+        return {'board': board.id,
+                'gains': [board.pot_thermopile, board.pot_thermistor],
+                'settle': settle, # Seconds left for new or restored gains
+                'r_zero': board.calibration.r_zero,
+                'tp_resp': board.calibration.tp_resp,
+                'curve_scale': board.calibration.curve_scale}
+
+    async def handle(self, request):
+        cmd = request.get('cmd')
+        if cmd == 'list':
+            return [self.board_state(board) for board in self.pool.boards.values()]
+
+        if cmd in ('state', 'measure', 'set_gains', 'adjust_gains', 'auto_gain'):
+            board = self.board(request)
+            if cmd == 'measure':
+                readings = await board.run_io(board.get_measurement,
+                                              request.get('broadcast', False))
+                # The state too, so clients flag readings while gains settle
+                return {**self.board_state(board), 'readings': readings}
+            if cmd == 'set_gains':
+                await board.run_io(board.set_gains, request['thermopile'],
+                                   request['thermistor'], request.get('broadcast', False))
+            elif cmd == 'adjust_gains':
+                await board.run_io(board.adjust_gains, request['thermopile'],
+                                   request['thermistor'])
+            elif cmd == 'auto_gain':
+                await board.run_io(board.auto_gain, request.get('start'))
+            return self.board_state(board)
+
+        if cmd == 'controller':
+            if self.controller is None:
+                raise DaemonError('No temperature controller.')
+            method = request['method']
+            if method not in CONTROLLER_METHODS:
+                raise DaemonError(f'Controller method {method} not allowed.')
+            return await self.controller_worker.run(getattr(self.controller, method),
+                                                    *request.get('args', []),
+                                                    **request.get('kwargs', {}))
+
+        raise DaemonError(f'Unknown command {cmd}.')
+
+    async def serve_client(self, reader, writer):
+        while line := await reader.readline():
+            try:
+                reply = {'ok': True, 'result': await self.handle(json.loads(line))}
+            except Exception as exp: # Report every failure to the client
+                logger.warning('Request failed: %s', exp)
+                reply = {'ok': False, 'error': str(exp), 'type': type(exp).__name__}
+            writer.write(json.dumps(reply).encode('utf8') + b'\n')
+            await writer.drain()
+        writer.close()
+
+    async def serve(self, path):
+        server = await asyncio.start_unix_server(self.serve_client, path)
+        logger.info('Serving on %s', path)
+        async with server:
+            await server.serve_forever()
+
+
+class DaemonClient:
+    def __init__(self, path):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self.stream = self.socket.makefile('rwb')
+
+    def close(self):
+        self.stream.close()
+        self.socket.close()
+
+    def request(self, cmd, **kwargs):
+        self.stream.write(json.dumps({'cmd': cmd, **kwargs}).encode('utf8') + b'\n')
+        self.stream.flush()
+        line = self.stream.readline()
+        if not line:
+            raise ConnectionError('Daemon closed the connection.')
+        return self.result(json.loads(line))
+
+    @staticmethod
+    def result(reply):
+        """Result of a decoded reply, raising the error it reports."""
+        if reply['ok']:
+            return reply['result']
+        if reply['type'] == 'LinkDown':
+            raise LinkDown(reply['error']) # Still a TimeoutError, as sampling expects
+        if reply['type'] == 'TimeoutError':
+            raise TimeoutError(reply['error'])
+        raise DaemonError(reply['error'])
+
+
+class RemotePyrometer(pyrometer.PyrometerSerial):
+    """A board owned by the daemon. Conversions still happen locally."""
+
+    def __init__(self, client, device_id, calibration=None):
+        super().__init__(device_id, None, calibration) # No port of its own
+        self.client = client
+        state = client.request('state', board=device_id)
+        self.update_gains(state)
+        if calibration is None:
+            self.calibration = pyrometer.PyrometerCalibration(state['r_zero'],
+                                                              state['tp_resp'],
+                                                              state['curve_scale'])
+
+    def update_gains(self, state):
+        self.pot_thermopile, self.pot_thermistor = state['gains']
+        # Follow gains the daemon set or restored, whichever client asked
+        self.settle_until = self.clock.time() + state['settle'] if state['settle'] else None
+
+    def open(self):
+        pass
+
+    def close(self):
+        self.client.close()
+
+    def get_measurement(self, broadcast=False):
+        state = self.client.request('measure', board=self.id, broadcast=broadcast)
+        self.update_gains(state)
+        return tuple(state['readings'])
+
+    def set_gains(self, thermopile_gain, thermistor_gain, broadcast=False):
+        self.update_gains(self.client.request('set_gains', board=self.id,
+                                              thermopile=thermopile_gain,
+                                              thermistor=thermistor_gain,
+                                              broadcast=broadcast))
+
+    def adjust_gains(self, thermopile_gain, thermistor_gain):
+        self.update_gains(self.client.request('adjust_gains', board=self.id,
+                                              thermopile=thermopile_gain,
+                                              thermistor=thermistor_gain))
+
+    def auto_gain(self, start=None):
+        self.update_gains(self.client.request('auto_gain', board=self.id,
+                                              start=start))
+        return self.pot_thermopile, self.pot_thermistor
+
+
+class RemoteController:
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name):
+        if name not in CONTROLLER_METHODS:
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            return self.client.request('controller', method=name,
+                                       args=args, kwargs=kwargs)
+        return call
@@ -0,0 +1,125 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import serial
+import serial.tools.list_ports
+from uw_pyrometer.pyrometer import PyrometerSerial
+
+logger = logging.getLogger(__name__)
+
+PROBE_WINDOW = 16 # Probes in flight on a port
+LATENCY = 0.1 # Seconds for a board to answer through a USB serial adapter
+REQUEST_SIZE = 3
+REPLY_SIZE = 9 # Sync, id, echoed command and three readings
+DEVICE_IDS = range(255) # 0xFF is broadcast
+
+
+def probe_frames(device_ids):
+    return b''.join(bytes([PyrometerSerial.SYNC_WORD, i, PyrometerSerial.CMD_REPORT])
+                    for i in device_ids)
+
+
+def parse_replies(data, device_ids):
+    """Readings in a stream of replies, by device id.
+
+    Replies are found by their sync word, id and echoed command. Readings
+    are 10 bit, which rejects echoed requests and most misaligned matches.
+    """
+    device_ids = set(device_ids)
+    found = {}
+    i = 0
+    while i + REPLY_SIZE <= len(data):
+        frame = data[i:i + REPLY_SIZE]
+        if (frame[0] == PyrometerSerial.SYNC_WORD and frame[1] in device_ids
+                and frame[2] == PyrometerSerial.CMD_REPORT):
+            tp, tr, ref = (int.from_bytes(frame[j:j + 2], 'big') for j in (3, 5, 7))
+            if max(tp, tr, ref) < 1024:
+                found[frame[1]] = (ref, tr, tp)
+                i += REPLY_SIZE
+                continue
+        i += 1
+    return found
+
+
+def probe_port(port, device_ids=DEVICE_IDS, window=PROBE_WINDOW, latency=LATENCY):
+    """Device ids answering on one port, with a first reading from each.
+
+    Report requests go out ``window`` at a time, back to back. Replies are
+    read until the line stays quiet for ``latency`` past the time the
+    frames take on the wire. Every window's replies are parsed together, so
+    a slow board answering during the next window is still found.
+    """
+    opened = isinstance(port, str)
+    if opened:
+        # Exclusive, so a bus owned by the daemon or a running routine is skipped
+        port = serial.Serial(port, **{**PyrometerSerial.serial_kw_args, 'timeout': latency},
+                             exclusive=True)
+    byte_time = 10 / getattr(port, 'baudrate', PyrometerSerial.serial_kw_args['baudrate'])
+    device_ids = list(device_ids)
+    data = bytearray()
+    try:
+        for start in range(0, len(device_ids), window):
+            batch = device_ids[start:start + window]
+            port.write(probe_frames(batch))
+            port.flush()
+            # The requests have to go out before the first reply can come back
+            port.timeout = latency + (REQUEST_SIZE * len(batch) + REPLY_SIZE) * byte_time
+            while chunk := port.read(max(1, port.in_waiting)):
+                data += chunk
+                port.timeout = latency + REPLY_SIZE * byte_time
+    finally:
+        if opened:
+            port.close()
+    return parse_replies(bytes(data), device_ids)
+
+
+def serial_ports():
+    return sorted(p.device for p in serial.tools.list_ports.comports())
+
+
+def discover(ports=None, device_ids=DEVICE_IDS, window=PROBE_WINDOW, latency=LATENCY):
+    """Find the boards on every port, probing all ports at once.
+
+    Returns a device map and the ports skipped. The map has a dict per
+    board with its ``port``, ``id``, ``responding`` and ``gains``, which a
+    board can't report, so None. Skipped ports map to the reason, such as
+    being open in another process.
+    """
+    ports = serial_ports() if ports is None else list(ports)
+    if not ports:
+        return [], {}
+
+    def scan(path):
+        try:
+            return probe_port(path, device_ids, window, latency)
+        except (OSError, serial.SerialException) as exp:
+            logger.warning('Skipped %s: %s', path, exp)
+            return exp
+
+    with ThreadPoolExecutor(len(ports), thread_name_prefix='discover') as executor:
+        results = list(executor.map(scan, ports))
+    devices = [{'port': path, 'id': device_id, 'responding': True, 'gains': None}
+               for path, found in zip(ports, results) if isinstance(found, dict)
+               for device_id in sorted(found)]
+    skipped = {path: str(found) for path, found in zip(ports, results)
+               if not isinstance(found, dict)}
+    return devices, skipped
+
+
+def daemon_devices(socket_path):
+    """Device map of the boards a daemon owns, with their gains."""
+    from uw_pyrometer import daemon
+
+    client = daemon.DaemonClient(socket_path)
+    try:
+        devices = []
+        for state in client.request('list'):
+            try:
+                client.request('measure', board=state['board'])
+                responding = True
+            except (TimeoutError, daemon.DaemonError):
+                responding = False
+            devices.append({'port': socket_path, 'id': state['board'],
+                            'responding': responding, 'gains': state['gains']})
+        return devices
+    finally:
+        client.close()
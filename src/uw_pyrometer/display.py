@@ -0,0 +1,107 @@
+import sys
+import math
+import threading
+from uw_pyrometer.clock import SYSTEM_CLOCK
+
+FRAME_RATE = 10.0 # Redraws per second
+CURSOR_UP = '\x1b[{}F' # To the start of a line n lines up
+CLEAR_LINE = '\x1b[K' # From the cursor to the end of the line
+CLEAR_BELOW = '\x1b[J' # From the cursor to the end of the screen
+
+
+class LiveDisplay:
+    """Redraw a block of terminal lines at a fixed frame rate.
+
+    The acquisition side changes whatever ``render`` reads while holding
+    ``lock``, then calls ``refresh``, which only marks the display stale. A
+    separate thread calls ``render`` at most ``rate`` times a second, so
+    output never holds up sampling. In place, each frame is drawn over the
+    last with cursor movement rather than clearing the screen. Otherwise,
+    as when output isn't a terminal, frames are appended.
+
+    Without the thread, calling ``poll`` often gives the same frame rate.
+    """
+
+    def __init__(self, render, rate=FRAME_RATE, stream=None, in_place=True,
+                 clock=SYSTEM_CLOCK):
+        self.render = render
+        self.clock = clock
+        self.period = 1 / rate
+        self.stream = sys.stdout if stream is None else stream
+        self.in_place = in_place and self.stream.isatty()
+        self.lock = threading.Lock()
+        self.frames = 0
+        self._stale = False
+        self._messages = []
+        self._height = 0 # Lines in the last frame
+        self._drawn_at = -math.inf
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        self._stale = True
+
+    def echo(self, message):
+        """Print a line above the display."""
+        with self.lock:
+            self._messages.append(message)
+        self._stale = True
+
+    def draw(self):
+        self._drawn_at = self.clock.time()
+        with self.lock:
+            self._stale = False
+            messages, self._messages = self._messages, []
+            lines = self.render()
+        if not (lines or messages):
+            return
+
+        end = CLEAR_LINE + '\n' if self.in_place else '\n'
+        out = []
+        if self.in_place and self._height:
+            out.append(CURSOR_UP.format(self._height))
+        out.extend(message + end for message in messages)
+        if lines and not self.in_place:
+            out.append('\n')
+        out.extend(line + end for line in lines or [])
+        self._height = len(lines or [])
+        if self.in_place:
+            out.append(CLEAR_BELOW) # Leftovers of a taller frame
+        self.stream.write(''.join(out))
+        self.stream.flush()
+        self.frames += 1
+
+    def poll(self):
+        """Draw if there are changes and a frame period has passed."""
+        if self._stale and self.clock.time() - self._drawn_at >= self.period:
+            self.draw()
+
+    def _wait_time(self):
+        if not self._stale:
+            return self.period
+        return min(max(self._drawn_at + self.period - self.clock.time(), 0.0), self.period)
+
+    def _run(self):
+        while not self._stop.wait(self._wait_time()):
+            self.poll()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='display', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the redraw thread, drawing anything not yet shown."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._stale:
+            self.draw()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
@@ -1,65 +1,47 @@
+import os
+import json
 import time
 import asyncio
 import logging
 from importlib.resources import files as imp_files
 import numpy as np
-import matplotlib.pyplot as plt
 import uw_pyrometer
+from uw_pyrometer import tables, filters
+from uw_pyrometer.clock import SYSTEM_CLOCK
+from uw_pyrometer.scheduler import FixedRateScheduler
 
 T_DEADBAND = 0.2
+BLOCK_POLL_INTERVAL = 2.0 # Seconds between controller reads while sampling
 TEST_TIMEOUT = 600  # Seconds
-data = np.loadtxt(imp_files(uw_pyrometer)/'data/bandpass.csv', delimiter=',')
-BP_TEMP = data[:, 0]
-BP_VAL = data[:, 1]
+BOOTSTRAP_SAMPLES = 2000
+OUTLIER_WINDOW = 15 # Samples in the rolling median
+OUTLIER_THRESHOLD = 6.0 # Robust standard deviations
+CHECKPOINT_VERSION = 1
 
 PLOT_STYLE = imp_files(uw_pyrometer) / 'plot_style.mplstyle'
 
 logger = logging.getLogger(__name__)
 
-class EmissivityVis(plt.Figure):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.make_emissivity_ax()
-
-    def set_txlim(self, l_lim, r_lim):
-        k = uw_pyrometer.pyrometer.RESPONSIVITY * bandpass(22.0)
-        x_lim = [1e6*k*to_k(x)**4 for x in (l_lim, r_lim)]
-        self.ax.set_xlim(*x_lim)
-
-    def make_emissivity_ax(self):
-        self.ax = self.add_subplot(111)
-        self.ax.set_xlabel(r'Blackbody Power (\si{\micro\watt})')
-        self.ax.set_ylabel(r'Total Received Power (\si{\micro\watt})')
-        self.set_txlim(15, 130)
-        self.ax.set_ylim(*self.ax.get_xlim())
-        # Fig should be created with
-        self.scatter = self.ax.scatter([], [])
-        self.fit, = self.ax.plot([], [], ls=':')
-
-        self.label = self.ax.annotate('No Data', (.47, .52), (.15, .7),
-                                      xycoords='axes fraction',
-                                      arrowprops=dict(facecolor='black',
-                                                      width=0.1, headwidth=4,
-                                                      headlength=6, shrink=.05))
-    def update_emissivity(self, x, y, bg, e):
-        self.scatter.set_offsets(np.c_[1e6*x, 1e6*y])
-
-        fit_x = np.linspace(*self.ax.get_xlim(), 100)
-        fit_y = e * fit_x + bg*1e6
-        self.fit.set_xdata(fit_x)
-        self.fit.set_ydata(fit_y)
-
-        self.label.set_text(r' $ \SI{' f'{e:.3f}' r'}{} \sigma T^4 + \SI{' f'{1e6*bg:.1f}' r'}{\micro\watt} $')
-
-        self.ax.set_ylim([1e6*bg+e*x for x in self.ax.get_xlim()])
-        # self.label.set_position((fit_x[65], e * fit_x[65] + 1e6*bg))
+
+def __getattr__(name):
+    # matplotlib and the bandpass table are only loaded when needed
+    if name == 'EmissivityVis':
+        from uw_pyrometer.vis import EmissivityVis
+        return EmissivityVis
+    if name == 'BP_TEMP':
+        return tables.load_table('bandpass')[:, 0]
+    if name == 'BP_VAL':
+        return tables.load_table('bandpass')[:, 1]
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
 
 def to_k(temperature):
     return 273.15 + temperature
 
 
 def bandpass(temperatue):
-    return np.interp(temperatue, BP_TEMP, BP_VAL)
+    table = tables.load_table('bandpass')
+    return np.interp(temperatue, table[:, 0], table[:, 1])
 
 
 def analyze_emissivity(measurements, plot_elements=None, output=None):
@@ -72,111 +54,408 @@ def analyze_emissivity(measurements, plot_elements=None, output=None):
         logger.info('Writting done')
 
     # Regression
-    
     temp = np.double(measurements['block_temp'])
     k = uw_pyrometer.pyrometer.RESPONSIVITY # G * sigma
     x = k * bandpass(temp)*to_k(temp)**4
     temp_tp = np.double(measurements['temp'])
     power = 1e-6 * np.double(measurements['power'])
     y = power + k * bandpass(temp_tp)*to_k(temp_tp)**4
-    if len(measurements['block_temp']) >= 2:
-        p, info = np.polynomial.polynomial.Polynomial.fit(x, y, 1, full=True)
-        background, emissivity = p.convert().coef
+    if 'set_point' in measurements:
+        points = np.double(measurements['set_point'])
+    else:
+        points = np.arange(len(x)) # Every row is its own point
+    if 'flags' in measurements:
+        # Leave out samples taken while gains settled after a board reset
+        good = np.double(measurements['flags']) == 0
+        x, y, points = x[good], y[good], points[good]
+    x_mean, y_mean, x_var, y_var = point_means(x, y, points)
+    if len(x_mean) >= 2:
+        emissivity, background, covariance = fit_uncertainty(x_mean, y_mean,
+                                                             x_var, y_var)
     else:
         background = 1e-6 * measurements['power'][0]
         emissivity = 1.0
-    # TODO: Calcualte Error
+        covariance = np.full((2, 2), np.nan)
 
     # Plot scatter
     if plot_elements is not None:
-        plot_elements.update_emissivity(x, y, background, emissivity)
-        plt.show(block=False)
-        plt.pause(5.0)
-
-    return emissivity, background
-
-
-async def set_and_wait(device, set_temp):
+        plot_elements.update_emissivity(x, y, background, emissivity, covariance)
+
+    return emissivity, background, covariance
+
+
+def read_csv(path):
+    """Load a run written by analyze_emissivity as a dict of columns."""
+    with open(path, encoding='utf8') as f:
+        header = f.readline().strip().split(',')
+        data = {k: [] for k in header}
+        for row in f.readlines():
+            for k, v in zip(header, row.strip().split(',')):
+                data[k].append(float(v))
+    return data
+
+
+def save_figure(data, figure_path):
+    """Plot a saved run's fit to figure_path without a display."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from uw_pyrometer.vis import EmissivityVis
+
+    with plt.style.context(PLOT_STYLE): # Leaves the worker's defaults alone
+        plot_elements = EmissivityVis()
+        plot_elements.set_txlim(min(data['block_temp'])-10,
+                                max(data['block_temp'])+10)
+        analyze_emissivity(data, plot_elements)
+        plot_elements.savefig(figure_path)
+
+
+def reanalyze(path, figure_path=None):
+    """Fit one saved run, optionally saving its figure without a display.
+
+    Meant to run in a worker process, so failures are returned, not raised.
+    A figure that fails keeps the fit, with ``figure_error`` set.
+    """
+    summary = {'path': str(path)}
+    try:
+        data = read_csv(path)
+        e, bg, cov = analyze_emissivity(data)
+        e_err, bg_err = np.sqrt(np.diag(cov))
+        summary.update(points=len(set(data.get('set_point', data['block_temp']))),
+                       samples=len(data['block_temp']),
+                       emissivity=e, emissivity_err=e_err,
+                       background=1e6*bg, background_err=1e6*bg_err)
+    except Exception as exp: # One bad file should not stop a batch
+        summary['error'] = f'{type(exp).__name__}: {exp}'
+        return summary
+
+    if figure_path is not None:
+        try:
+            save_figure(data, figure_path)
+        except Exception as exp: # e.g. no LaTeX for the labels
+            summary['figure_error'] = f'{type(exp).__name__}: {exp}'
+    return summary
+
+
+def point_means(x, y, points):
+    """Mean x and y per set point, with the variance of each mean.
+
+    Variances are nan for points with a single sample.
+    """
+    _, index, counts = np.unique(points, return_inverse=True, return_counts=True)
+    index = index.ravel()
+    x_mean = np.bincount(index, x) / counts
+    y_mean = np.bincount(index, y) / counts
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = 1 / (counts * (counts - 1)) # Sample variance over n
+        x_var = np.bincount(index, (x - x_mean[index])**2) * scale
+        y_var = np.bincount(index, (y - y_mean[index])**2) * scale
+    x_var[counts < 2] = np.nan
+    y_var[counts < 2] = np.nan
+    return x_mean, y_mean, x_var, y_var
+
+
+def line_fit(x, y, weights):
+    """Weighted least squares line along the last axis.
+
+    Leading axes are independent fits. Returns (slope, intercept).
+    """
+    total = weights.sum(-1)
+    x_center = (weights * x).sum(-1) / total
+    y_center = (weights * y).sum(-1) / total
+    dx = x - x_center[..., None]
+    slope = ((weights * dx * (y - y_center[..., None])).sum(-1)
+             / (weights * dx**2).sum(-1))
+    return slope, y_center - slope * x_center
+
+
+def fit_uncertainty(x, y, x_var, y_var, samples=BOOTSTRAP_SAMPLES, seed=0):
+    """Fit emissivity and background with their covariance.
+
+    Points are weighted by their effective variance, which includes the
+    block temperature noise through ``x_var``. The covariance comes from a
+    parametric bootstrap, where every resample moves each point by its own
+    error. All resamples are fit at once as one array operation.
+    """
+    ones = np.ones_like(x)
+    slope, intercept = line_fit(x, y, ones)
+
+    if np.all(np.isnan(y_var)):
+        # No repeat samples, so take the noise from the scatter about the line
+        dof = len(x) - 2
+        residual = np.sum((y - slope * x - intercept)**2) / dof if dof else np.nan
+        y_var = residual * ones
+    x_var = np.where(np.isnan(x_var), 0.0, x_var)
+    y_var = np.where(np.isnan(y_var), np.nanmean(y_var), y_var)
+
+    variance = y_var + slope**2 * x_var
+    if not np.all(variance > 0):
+        return slope, intercept, np.full((2, 2), np.nan)
+    weights = 1 / variance
+    slope, intercept = line_fit(x, y, weights)
+
+    rng = np.random.default_rng(seed)
+    noise = rng.standard_normal((2, samples, len(x)))
+    x_boot = x + np.sqrt(x_var) * noise[0]
+    y_boot = y + np.sqrt(y_var) * noise[1]
+    covariance = np.cov(line_fit(x_boot, y_boot, weights))
+
+    # Scatter beyond the sample noise inflates the errors (Birge ratio)
+    dof = len(x) - 2
+    if dof > 0:
+        chi2 = np.sum(weights * (y - slope * x - intercept)**2)
+        covariance *= max(1.0, chi2 / dof)
+    return slope, intercept, covariance
+
+
+async def set_and_wait(device, set_temp, clock=SYSTEM_CLOCK, heater_log=None):
+    """Move the block to set_temp, logging (time, temp, set point) polls."""
     device.sp(val=set_temp, save=False, index=2)
-    await asyncio.sleep(3.0)
+    await clock.async_sleep(3.0)
     device.restart()
-    await asyncio.sleep(3.0)
-
-    while abs(device.val() - set_temp) > T_DEADBAND:
+    await clock.async_sleep(3.0)
+
+    while True:
+        temp = device.val()
+        if heater_log is not None:
+            heater_log.append((clock.time(), temp, set_temp))
+        if abs(temp - set_temp) <= T_DEADBAND:
+            break
         logger.debug('Not at temperature yet')
-        await asyncio.sleep(20.0)
+        await clock.async_sleep(20.0)
+
+
+def warm_up(device, temp, seconds, clock=SYSTEM_CLOCK, heater_log=None):
+    """Soak the block at temp before a sweep."""
+    print('Warm up:', temp)
+    asyncio.run(set_and_wait(device, temp, clock, heater_log))
+    clock.sleep(seconds)
+
+
+async def get_block_temps(device, end_signal, clock=SYSTEM_CLOCK,
+                          interval=BLOCK_POLL_INTERVAL):
+    """Poll the block temperature until end_signal, with read times.
+
+    Reads run in a thread, so a slow controller reply doesn't hold up the
+    boards sampling on the same event loop.
+    """
+    times, temps = [], []
+    scheduler = FixedRateScheduler(interval, clock)
+    while True:
+        finished = end_signal.is_set() # One more read after the end brackets the samples
+        await scheduler.wait()
+        start = clock.time()
+        temps.append(await asyncio.to_thread(device.val))
+        times.append((start + clock.time()) / 2)
+        if finished:
+            break
+    logger.debug('Done measuring temp')
+    return times, temps
 
 
-async def get_avg_temp(device, end_signal, callback_f):
-    temp_samples = [device.val()]
-    while not end_signal.is_set():
-        # Don't check too often
-        await asyncio.sleep(10.0)
-        temp_samples.append(device.val())
-    logger.debug('Done measuring temp')
-    v = sum(temp_samples)/len(temp_samples)
-    callback_f(v)
-    return v
+def align_block_temps(sample_times, temp_times, temps):
+    """Interpolate block temperature readings onto the sample times."""
+    return np.interp(sample_times, temp_times, temps)
 
 
-async def run_temps(tp_dev, temp_dev, temps, samples, interval, update_f=None):
-    measurements = {x: [] for x in uw_pyrometer.pyrometer.MEAS_NAMES}
-    measurements['block_temp'] = []
-    measurements['tp_gain'] = []
-    measurements['tr_gain'] = []
+def flag_outliers(history, keys=('power', 'temp')):
+    """Flag glitched samples in one set point's history so fits skip them."""
+    flags = np.array(history['flags'], dtype=int)
+    for key in keys:
+        values = np.asarray(history[key])
+        # At least a few ADC steps, or a quiet signal flags every step
+        steps = np.diff(np.unique(values))
+        quantum = steps.min() if len(steps) else 0.0
+        mask, _ = filters.MedianReject(OUTLIER_WINDOW, OUTLIER_THRESHOLD,
+                                       quantum).outliers(values)
+        flags[mask] |= uw_pyrometer.pyrometer.FLAG_OUTLIER
+    if np.any(flags & uw_pyrometer.pyrometer.FLAG_OUTLIER):
+        logger.info('%s outlier samples flagged',
+                    np.count_nonzero(flags & uw_pyrometer.pyrometer.FLAG_OUTLIER))
+    history['flags'] = flags.tolist()
 
-    def update_w_print(m):
-        for k, v in m.items():
-            measurements[k].append(v)
 
-        temp = m['temp']
-        power = m['power']
-        print(f'{temp:.1f} C, {power:.1f} uW')
-        
-        if update_f is not None:
-            update_f(measurements) # For plotting, or other updates
-    
-    tp_sampled = asyncio.Event()
-    gains = None
-    for t in temps:
-        print('Temp:', t)
-        await set_and_wait(temp_dev, t)
-        logger.info('Setting gains')
+def save_checkpoint(path, state):
+    """Write a run's state, replacing the old checkpoint only once complete."""
+    state = {'version': CHECKPOINT_VERSION, **state}
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf8') as f:
+        json.dump(state, f, default=lambda x: x.item()) # numpy scalars
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
 
-        gains = await asyncio.to_thread(tp_dev.auto_gain, gains)
-        measurements['tp_gain'].append(gains[0])
-        measurements['tr_gain'].append(gains[1])
-        tp_sampled.clear()
+def load_checkpoint(path):
+    with open(path, encoding='utf8') as f:
+        state = json.load(f)
+    if state.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f'Unsupported checkpoint version in {path}.')
+    return state
 
-        sample_task = asyncio.create_task(tp_dev.sample(samples, interval, tp_sampled))
-        measure_task = asyncio.create_task(get_avg_temp(temp_dev, tp_sampled, measurements['block_temp'].append))
 
-        await tp_sampled.wait()
-        await measure_task
-        update_w_print(await sample_task)
-        
+def remaining_temps(temps, resume):
+    """Set points not yet completed in a resumed run."""
+    done = {point['set_point'] for point in (resume or {}).get('completed', [])}
+    return [t for t in temps if t not in done]
 
+
+def new_measurements():
+    measurements = {x: [] for x in uw_pyrometer.pyrometer.MEAS_NAMES}
+    measurements['block_temp'] = []
+    measurements['set_point'] = []
     return measurements
 
 
-def run(tp_dev, temp_dev, temps, samples, interval, plot=False, output=None):
-    update_f = None
-    vis = None
+async def run_temps(tp_dev, temp_dev, temps, samples, interval, update_f=None,
+                    clock=SYSTEM_CLOCK, precision=None, heater_log=None,
+                    checkpoint=None, resume=None, track_gains=False):
+    """Measure at each set point in turn.
+
+    ``tp_dev`` may be a list of boards watching the same block. They auto
+    gain and sample concurrently, and a list of measurements is returned,
+    one per board. Boards on one port auto gain together, see
+    fleet_auto_gain.
+
+    After every set point the measurements, gains and controller state are
+    saved to ``checkpoint``. A loaded checkpoint passed as ``resume`` skips
+    its completed set points and starts auto gain from its gains.
+
+    ``track_gains`` lets the boards adjust gains while sampling, see
+    PyrometerSerial.sample.
+    """
+    single = not isinstance(tp_dev, (list, tuple))
+    boards = [tp_dev] if single else list(tp_dev)
+    measurements = [new_measurements() for _ in boards]
+    completed = []
+    if resume is not None:
+        for board_measurements, saved in zip(measurements, resume.get('measurements', [])):
+            for k, v in saved.items():
+                board_measurements[k].extend(v)
+        completed = list(resume['completed'])
+        temps = remaining_temps(temps, resume)
+        print(f'Resuming: {len(completed)} set points done, {len(temps)} to go')
+
+    def update_w_print(board, history, block_temps, set_point):
+        n = len(history['time'])
+        flag_outliers(history)
+        board_measurements = measurements[boards.index(board)]
+        for k, v in history.items():
+            board_measurements[k].extend(v)
+        board_measurements['block_temp'].extend(block_temps)
+        board_measurements['set_point'].extend([set_point] * n)
+
+        good = np.array(history['flags']) == 0
+        temp = np.mean(np.array(history['temp'])[good])
+        power = np.mean(np.array(history['power'])[good])
+        drift = block_temps[-1] - block_temps[0]
+        prefix = '' if single else f'Board {board.id}: '
+        print(f'{prefix}{temp:.1f} C, {power:.1f} uW, block drift {drift:+.2f} C')
+        if precision:
+            sem = np.std(np.array(history['power'])[good], ddof=1) / np.sqrt(good.sum())
+            print(f'{prefix}{n} samples, power standard error {sem:.3f} uW')
+
+    # Boards sharing a port worker are on one bus, so auto gain them together
+    shared_bus = len(boards) > 1 and all(board.worker is not None
+                                         and board.worker is boards[0].worker
+                                         for board in boards)
+    sampled = asyncio.Event()
+    gains = [None] * len(boards)
+    if completed:
+        gains = [tuple(g) for g in completed[-1]['gains']]
+    for t in temps:
+        print('Temp:', t)
+        await set_and_wait(temp_dev, t, clock, heater_log)
+        logger.info('Setting gains')
+
+        if shared_bus:
+            gains = await boards[0].run_io(uw_pyrometer.pyrometer.fleet_auto_gain,
+                                           boards, gains)
+        else:
+            gains = await asyncio.gather(*(board.run_io(board.auto_gain, board_gains)
+                                           for board, board_gains in zip(boards, gains)))
+        sampled.clear()
+
+        histories = [{x: [] for x in uw_pyrometer.pyrometer.MEAS_NAMES} for _ in boards]
+        sample_tasks = [asyncio.create_task(board.sample(samples, interval,
+                                                         history=history,
+                                                         precision=precision,
+                                                         track_gains=track_gains))
+                        for board, history in zip(boards, histories)]
+        measure_task = asyncio.create_task(get_block_temps(temp_dev, sampled, clock))
+
+        try:
+            await asyncio.gather(*sample_tasks)
+        finally:
+            sampled.set() # Stop polling the block, even if sampling failed
+        temp_times, block_temps = await measure_task
+        for board, history in zip(boards, histories):
+            update_w_print(board, history,
+                           align_block_temps(history['time'], temp_times, block_temps), t)
+        # Tracking may have moved the gains since auto gain
+        gains = [(board.pot_thermopile, board.pot_thermistor) for board in boards]
+        if update_f is not None:
+            update_f(measurements[0] if single else measurements) # For plotting, or other updates
+
+        completed.append({'set_point': t, 'gains': gains,
+                          'block_temp': block_temps[-1], 'time': clock.time()})
+        if checkpoint is not None:
+            save_checkpoint(checkpoint, {'measurements': measurements,
+                                         'completed': completed})
+            logger.info('Checkpoint saved after %s', t)
+
+    return measurements[0] if single else measurements
+
+
+def board_output(output, device_id):
+    """Output path for one of several boards, e.g. run.csv to run_13.csv."""
+    if output is None:
+        return None
+    root, ext = os.path.splitext(output)
+    return f'{root}_{device_id}{ext}'
+
+
+def run(tp_dev, temp_dev, temps, samples, interval, plot=False, output=None,
+        clock=SYSTEM_CLOCK, precision=None, heater_log=None, checkpoint=None,
+        resume=None, track_gains=False):
+    """Run the routine and fit each board.
+
+    With several boards each gets its own csv, named by board_output.
+    Returns (emissivity, background, covariance) for each board.
+    """
+    single = not isinstance(tp_dev, (list, tuple))
+    boards = [tp_dev] if single else list(tp_dev)
+    outputs = [output] if single else [board_output(output, b.id) for b in boards]
+    plots = [None] * len(boards)
     if plot:
+        from uw_pyrometer.vis import LivePlot
+
         logger.info('Setting up plots')
-        plt.style.use(PLOT_STYLE)
-        plt.ion()
-        vis = EmissivityVis()
-        plt.figure().canvas.manager.canvas.figure = vis
-        plt.show(block=False)
-        plt.pause(2.0)
-
-    fig = None if plot else None # Matplotlib gui figure window
-    update_f = lambda x: analyze_emissivity(x, vis, output)
-
-    measurements = asyncio.run(run_temps(tp_dev, temp_dev, temps,
-                                          samples, interval, update_f))
-    analyze_emissivity(measurements, fig, output)
+        plots = [LivePlot(PLOT_STYLE) for _ in boards]
+
+    def analyze(measurements):
+        return [analyze_emissivity(m, vis, out)
+                for m, vis, out in zip(measurements, plots, outputs)]
+
+    try:
+        measurements = asyncio.run(run_temps(boards, temp_dev, temps, samples,
+                                             interval, analyze, clock, precision,
+                                             heater_log, checkpoint, resume,
+                                             track_gains))
+        results = analyze(measurements)
+    except BaseException:
+        for vis in plots:
+            if vis is not None:
+                vis.close(wait=False) # Don't hold up an error or Ctrl-C on the window
+        raise
+    for vis in plots:
+        if vis is not None:
+            vis.close()
+    if not single:
+        for board, (e, bg, cov) in zip(boards, results):
+            print(f'Board {board.id}: emissivity {e:.3f} ± {np.sqrt(cov[0, 0]):.3f}, '
+                  f'background {1e6 * bg:.2f} uW')
+    return results
 
 
 def test(heat_block):
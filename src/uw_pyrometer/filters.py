@@ -0,0 +1,180 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+MAD_SCALE = 1.4826 # MAD to standard deviation for normal noise
+
+
+class Decimate:
+    """CIC decimation by ``factor``, with ``order`` cascaded boxcars.
+
+    Order 1 is a plain boxcar average of each ``factor`` samples. Output has
+    unity gain and one sample per ``factor`` inputs; leftover inputs wait
+    for the next block.
+    """
+
+    def __init__(self, factor, order=1):
+        if factor < 1 or order < 1:
+            raise ValueError('Factor and order must be at least one.')
+        self.factor = factor
+        self.order = order
+        kernel = np.ones(1)
+        for _ in range(order):
+            kernel = np.convolve(kernel, np.ones(factor))
+        self.kernel = kernel / factor**order
+        self.reset()
+
+    def reset(self):
+        self.history = np.empty(0)
+        self.count = 0 # Inputs seen
+
+    def process(self, block):
+        block = np.asarray(block, dtype=float)
+        data = np.concatenate([self.history, block])
+        offset = self.count - len(self.history) # Input index of data[0]
+        self.count += len(block)
+        if self.order == 1:
+            # Whole boxcars only; the rest waits for the next block
+            usable = len(data) - len(data) % self.factor
+            self.history = data[usable:]
+            return data[:usable].reshape(-1, self.factor).mean(axis=1)
+
+        # An output after every factor inputs, once the kernel is full
+        taps = len(self.kernel)
+        first = max(taps - 1, 0)
+        first += (-(offset + first + 1)) % self.factor
+        ends = np.arange(first, len(data), self.factor)
+        self.history = data[max(len(data) - (taps - 1), 0):] # Empty with one tap
+        if len(ends) == 0:
+            return np.empty(0)
+        windows = sliding_window_view(data, taps)[ends - (taps - 1)]
+        return windows @ self.kernel[::-1]
+
+
+class MedianReject:
+    """Replace outliers by the rolling median (a Hampel filter).
+
+    A sample more than ``threshold`` robust standard deviations from the
+    median of the ``window`` samples ending at it is an outlier. The MAD
+    floor ``min_spread`` stops quiet, quantized signals flagging every step.
+    """
+
+    def __init__(self, window=15, threshold=5.0, min_spread=0.0):
+        if window < 3:
+            raise ValueError('Window must be at least three samples.')
+        self.window = window
+        self.threshold = threshold
+        self.min_spread = min_spread
+        self.reset()
+
+    def reset(self):
+        self.history = np.empty(0)
+        self.rejected = 0
+
+    def outliers(self, block):
+        """Mask of outliers in block, and the medians they are judged by."""
+        block = np.asarray(block, dtype=float)
+        if len(block) == 0:
+            return np.zeros(0, dtype=bool), block
+        data = np.concatenate([self.history, block])
+        # Short history at the start: pad with the first sample
+        pad = max(self.window - 1 - len(self.history), 0)
+        data = np.concatenate([np.full(pad, data[0]), data])
+        windows = sliding_window_view(data, self.window)[-len(block):]
+        median = np.median(windows, axis=1)
+        spread = MAD_SCALE * np.median(np.abs(windows - median[:, None]), axis=1)
+        mask = np.abs(block - median) > self.threshold * np.maximum(spread, self.min_spread)
+        self.history = data[-(self.window - 1):]
+        return mask, median
+
+    def process(self, block):
+        block = np.array(block, dtype=float)
+        mask, median = self.outliers(block)
+        self.rejected += int(np.count_nonzero(mask))
+        block[mask] = median[mask]
+        return block
+
+
+class Kalman:
+    """Kalman filter for a slowly wandering level, such as temperature.
+
+    The level is a random walk with ``process_var`` per sample seen through
+    noise ``measurement_var``. The gains don't depend on the data, so a
+    block is filtered with cumulative products instead of a Python loop.
+    """
+
+    def __init__(self, process_var, measurement_var):
+        self.process_var = process_var
+        self.measurement_var = measurement_var
+        self.reset()
+
+    def reset(self):
+        self.level = None
+        self.variance = None
+
+    def _gains(self, n):
+        gains = np.empty(n)
+        for i in range(n):
+            predicted = self.variance + self.process_var
+            gains[i] = predicted / (predicted + self.measurement_var)
+            self.variance = (1 - gains[i]) * predicted
+            if i and gains[i] == gains[i - 1]:
+                gains[i:] = gains[i] # Converged, so the rest is the same
+                break
+        return gains
+
+    def process(self, block):
+        block = np.asarray(block, dtype=float)
+        out = np.empty_like(block)
+        start = 0
+        if self.level is None and len(block):
+            self.level, self.variance = block[0], self.measurement_var
+            out[0], start = block[0], 1
+
+        gains = self._gains(len(block) - start)
+        # level_n = (1 - k_n) level_n-1 + k_n z_n, solved with the running
+        # product of (1 - k), in segments short enough to stay representable
+        log_keep = np.log1p(-np.minimum(gains, 1 - 1e-12))
+        step = max(1, int(600 / max(-log_keep.min(initial=0.0), 1e-12)))
+        for seg in range(0, len(gains), step):
+            g = gains[seg:seg + step]
+            z = block[start + seg:start + seg + step]
+            a = np.exp(np.cumsum(log_keep[seg:seg + step]))
+            level = a * (self.level + np.cumsum(g * z / a))
+            out[start + seg:start + seg + len(z)] = level
+            self.level = level[-1]
+        return out
+
+
+class Pipeline:
+    """Stages applied in order to blocks of a sample stream."""
+
+    def __init__(self, *stages):
+        self.stages = stages
+
+    def reset(self):
+        for stage in self.stages:
+            stage.reset()
+
+    def process(self, block):
+        for stage in self.stages:
+            block = stage.process(block)
+        return block
+
+
+def parse_stage(spec):
+    """Build a stage from ``name:arg:arg``, e.g. ``cic:8:3`` or ``median:15``."""
+    name, *args = spec.split(':')
+    defaults = {'boxcar': (Decimate, (int, int), (4, 1)),
+                'cic': (Decimate, (int, int), (4, 3)),
+                'median': (MedianReject, (int, float), (15, 5.0)),
+                'kalman': (Kalman, (float, float), (1e-4, 1e-2))}
+    if name not in defaults:
+        raise ValueError(f'Unknown filter {name}.')
+    stage, kinds, values = defaults[name]
+    if len(args) > len(values):
+        raise ValueError(f'Too many arguments for {name}.')
+    try:
+        values = [kind(a) for kind, a in zip(kinds, args)] + list(values[len(args):])
+        return stage(*values)
+    except ValueError as exp:
+        raise ValueError(f'Bad filter {spec}: {exp}') from None
@@ -0,0 +1,71 @@
+import math
+import logging
+from uw_pyrometer.clock import SYSTEM_CLOCK
+
+logger = logging.getLogger(__name__)
+
+MIN_TIMEOUT = 0.1 # Seconds
+MAX_TIMEOUT = 8.0
+GRANULARITY = 0.01
+BREAKER_FAILURES = 5 # Timeouts in a row before a link is treated as down
+BREAKER_COOLDOWN = 30.0 # Seconds before a down link is tried again
+
+
+class LinkDown(TimeoutError):
+    """The device stopped answering; requests fail fast until a retry."""
+
+
+class LinkTimer:
+    """Reply timeout for one serial link, adapted to its round trip time.
+
+    The timeout follows a smoothed round trip time and its variation as in
+    TCP (RFC 6298), so a lost frame costs a few round trips instead of a
+    fixed worst case. Each timeout doubles it until a reply comes back.
+    After ``BREAKER_FAILURES`` timeouts in a row the link is marked down and
+    ``check`` fails at once for ``BREAKER_COOLDOWN`` seconds, then one
+    request is let through to probe it.
+    """
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+
+    def __init__(self, initial=1.0, clock=SYSTEM_CLOCK, name='link'):
+        self.name = name
+        self.clock = clock
+        self.srtt = None
+        self.rttvar = None
+        self.timeout = initial
+        self.failures = 0
+        self.down_until = None
+
+    def check(self):
+        """Raise LinkDown while the circuit breaker is open."""
+        if self.down_until is None:
+            return
+        if self.clock.time() < self.down_until:
+            raise LinkDown(f'{self.name} is not responding.')
+        self.down_until = None # Half open: probe with the longest timeout
+        self.timeout = MAX_TIMEOUT
+
+    def success(self, rtt):
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar += self.BETA * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += self.ALPHA * (rtt - self.srtt)
+        timeout = self.srtt + max(GRANULARITY, 4 * self.rttvar)
+        # Whole ticks, so the port isn't reconfigured for every small change
+        timeout = math.ceil(timeout / GRANULARITY) * GRANULARITY
+        self.timeout = min(max(timeout, MIN_TIMEOUT), MAX_TIMEOUT)
+        if self.failures >= BREAKER_FAILURES:
+            logger.warning('%s is responding again', self.name)
+        self.failures = 0
+
+    def failure(self):
+        self.failures += 1
+        self.timeout = min(2 * self.timeout, MAX_TIMEOUT)
+        if self.failures == BREAKER_FAILURES:
+            logger.warning('%s timed out %s times, backing off for %s s',
+                           self.name, self.failures, BREAKER_COOLDOWN)
+        if self.failures >= BREAKER_FAILURES:
+            self.down_until = self.clock.time() + BREAKER_COOLDOWN
@@ -18,6 +18,8 @@ import sys
 import time
 import serial
 import serial.tools.list_ports as slp
+from uw_pyrometer import wiretrace
+from uw_pyrometer.link import LinkTimer
 
 ATTEMPTS = 3
 BAUD = 9600
@@ -32,6 +34,8 @@ DISABLE_CMD = "D"
 WRITE_CMD = "W"
 PUT_CMD = "P"
 ECHO = 1
+OPEN_DELAY = 2
+TRACE_CHANNEL = 0xFF # Not a valid pyrometer id, so traces can share a file
 
 #
 # Configuration registers
@@ -93,7 +97,7 @@ def find_port_from_sn(sernum=None):
 
 
 class omega_pid:
-    def __init__ (self, sernum=None, port=None):
+    def __init__ (self, sernum=None, port=None, trace=None, open_delay=OPEN_DELAY):
         if (sernum is None) and (port is None):
             sys.exit(2)
         if port is None:
@@ -101,14 +105,20 @@ class omega_pid:
         if port is None:
             sys.exit(2)
         self.device = port
-        self.serial = serial.Serial(port, BAUD, \
-            timeout=TIMEOUT, parity=PARITY, stopbits=serial.STOPBITS_ONE,\
-            bytesize=serial.EIGHTBITS)
+        if isinstance(port, str):
+            self.serial = serial.Serial(port, BAUD, \
+                timeout=TIMEOUT, parity=PARITY, stopbits=serial.STOPBITS_ONE,\
+                bytesize=serial.EIGHTBITS)
+        else:
+            self.serial = port # Already open, e.g. a replay
+        if trace is not None:
+            self.serial = wiretrace.TracedSerial(self.serial, trace, TRACE_CHANNEL)
         # self.read   = self.serial.read
         # self.write  = self.serial.write
         # self.readline = self.serial.readline
         self.state = None
-        time.sleep(2)
+        self.link = LinkTimer(TIMEOUT, name='Temperature controller')
+        time.sleep(open_delay)
 
     def write(self, data, *args):
         self.serial.write(str.encode(data, 'ASCII'), *args)
@@ -132,24 +142,34 @@ class omega_pid:
 
     def val(self):
         # self.readline() # clean serial buffer
+        self.link.check()
         self.clear()
         # momentary temperature of the thermocouple
         cmd='X01'
-        self.write(REC_CHAR + cmd + EOL)
-        for _ in range(ATTEMPTS):
-            reply = self.readline()
-            # ('Val reply:', reply)
-            if (len(reply)>4):
-                if cmd in reply:
-                    rval = float(reply[3:-1])
+        # Only this read adapts; other commands keep the fixed TIMEOUT
+        timeout = self.serial.timeout
+        self.serial.timeout = self.link.timeout
+        try:
+            start = self.link.clock.time()
+            self.write(REC_CHAR + cmd + EOL)
+            for _ in range(ATTEMPTS):
+                reply = self.readline()
+                # ('Val reply:', reply)
+                if (len(reply)>4):
+                    if cmd in reply:
+                        rval = float(reply[3:-1])
+                    else:
+                        rval = float(reply[3:-1])
+                    self.link.success(self.link.clock.time() - start)
+                    break
                 else:
-                    rval = float(reply[3:-1])
-                break
+                    continue
             else:
-                continue
-        else:
-            raise TimeoutError('Value read timed out.')
-            rval = None
+                self.link.failure()
+                raise TimeoutError('Value read timed out.')
+                rval = None
+        finally:
+            self.serial.timeout = timeout
 
         return rval
 
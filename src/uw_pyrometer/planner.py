@@ -0,0 +1,126 @@
+import math
+import logging
+import itertools
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HEAT_RATE = 0.1 # C/s while the heater is saturated
+COOL_TAU = 1800.0 # s, exponential cooling toward ambient
+AMBIENT = 22.0 # C
+SETTLE_TIME = 120.0 # s from reaching the set point to holding it
+APPROACH = 1.0 # C from the set point where ramping ends and settling starts
+HISTORY_COLUMNS = ('time', 'temp', 'set_point')
+
+
+class HeaterModel:
+    """Predict how long the block takes to reach a set point.
+
+    Heating runs at a constant rate. Cooling is passive, decaying toward
+    ambient with time constant ``tau``, so going down is slow and can't go
+    below ambient. Every move ends with a fixed settle time.
+    """
+
+    def __init__(self, heat_rate=HEAT_RATE, tau=COOL_TAU, ambient=AMBIENT,
+                 settle=SETTLE_TIME):
+        self.heat_rate = heat_rate
+        self.tau = tau
+        self.ambient = ambient
+        self.settle = settle
+
+    def __repr__(self):
+        return (f'HeaterModel(heat_rate={self.heat_rate:.3g}, tau={self.tau:.4g}, '
+                f'ambient={self.ambient:.3g}, settle={self.settle:.3g})')
+
+    def ramp_time(self, start, target):
+        if abs(target - start) <= APPROACH:
+            return 0.0
+        if target > start:
+            return (target - APPROACH - start) / self.heat_rate
+        if target + APPROACH <= self.ambient:
+            return math.inf # Never cools that far
+        return self.tau * math.log((start - self.ambient) / (target + APPROACH - self.ambient))
+
+    def move_time(self, start, target):
+        return self.ramp_time(start, target) + self.settle
+
+    @classmethod
+    def fit(cls, times, temps, set_points):
+        """Fit to controller readings taken while moving between set points."""
+        times, temps, set_points = (np.asarray(a, dtype=float)
+                                    for a in (times, temps, set_points))
+        dt = np.diff(times)
+        rate = np.diff(temps) / np.where(dt > 0, dt, np.nan)
+        temp, target = temps[:-1], set_points[:-1]
+        same = (set_points[1:] == target) & (dt > 0)
+
+        model = cls()
+        heating = same & (target - temp > APPROACH) & np.isfinite(rate)
+        if np.count_nonzero(heating) >= 2:
+            model.heat_rate = float(np.median(rate[heating]))
+
+        # dT/dt = (ambient - T) / tau is linear in T
+        cooling = same & (temp - target > APPROACH) & np.isfinite(rate)
+        if np.count_nonzero(cooling) >= 3 and np.ptp(temp[cooling]) > APPROACH:
+            slope, offset = np.polyfit(temp[cooling], rate[cooling], 1)
+            if slope < 0:
+                model.tau = float(-1 / slope)
+                model.ambient = float(-offset / slope)
+
+        # Settle: time held near the set point before readings stay in the deadband
+        settles = []
+        for point in np.split(np.arange(len(temps)), np.flatnonzero(np.diff(set_points)) + 1):
+            near = np.flatnonzero(np.abs(temps[point] - set_points[point]) <= APPROACH)
+            if len(near):
+                settles.append(times[point][-1] - times[point][near[0]])
+        if settles:
+            model.settle = float(np.median(settles))
+        return model
+
+    @classmethod
+    def from_history(cls, path):
+        data = np.loadtxt(path, delimiter=',', skiprows=1, ndmin=2)
+        if len(data) < 2:
+            return cls()
+        return cls.fit(data[:, 0], data[:, 1], data[:, 2])
+
+
+def predicted_time(order, model, start, dwell=0.0, warmup=None):
+    """Seconds to visit the set points in order, dwelling at each.
+
+    Includes the optional ``warmup`` soak before the first set point, as
+    in plan.
+    """
+    total, temp = 0.0, start
+    if warmup is not None:
+        temp, warm_time = warmup
+        total = model.move_time(start, temp) + warm_time
+    for target in order:
+        total += model.move_time(temp, target) + dwell
+        temp = target
+    return total
+
+
+def plan(temps, model, start, dwell=0.0, warmup=None):
+    """Order set points to minimize predicted run time.
+
+    ``warmup`` is an optional (temperature, seconds) soak before the first
+    set point, which can make sense when the block starts below the sweep.
+    Returns (order, predicted seconds).
+    """
+    temps = list(temps)
+    if warmup is not None:
+        order, _ = plan(temps, model, warmup[0], dwell)
+        return order, predicted_time(order, model, start, dwell, warmup)
+
+    if len(temps) <= 8:
+        candidates = itertools.permutations(temps)
+    else:
+        # Cooling is the slow way, so sweep up then down, starting anywhere
+        ascending = sorted(temps)
+        candidates = [ascending, ascending[::-1], temps]
+        for split in range(1, len(temps)):
+            candidates.append(ascending[split:] + ascending[:split][::-1])
+            candidates.append(ascending[:split][::-1] + ascending[split:])
+    best = min(candidates, key=lambda order: predicted_time(order, model, start, dwell))
+    return list(best), predicted_time(best, model, start, dwell)
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import serial
+from uw_pyrometer import pyrometer
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = 4 # Calls waiting on one port before callers are held back
+
+
+class PortWorker:
+    """One thread doing all the blocking I/O for one serial port.
+
+    Calls run one at a time in the order they were made, so frames for
+    different boards on a port never interleave and ports never wait on each
+    other. At most ``depth`` calls queue for the thread; more callers wait in
+    the event loop, which keeps a slow or stuck port from piling up work.
+    """
+
+    def __init__(self, name, depth=QUEUE_DEPTH):
+        self.name = name
+        self.depth = depth
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix=f'port-{name}')
+        self.pending = 0 # Calls queued, running or held back
+        self._slots = None # Made on first use, inside the running loop
+
+    async def run(self, func, *args, **kwargs):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.depth)
+        self.pending += 1
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor,
+                                                  functools.partial(func, *args, **kwargs))
+        finally:
+            self.pending -= 1
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+class PortPool:
+    """Boards spread across serial ports, each port with its own worker.
+
+    Commands are routed by board id to the worker for that board's port, so
+    throughput grows with the number of adapters.
+    """
+
+    def __init__(self, depth=QUEUE_DEPTH):
+        self.depth = depth
+        self.ports = {} # path -> (serial, worker)
+        self.boards = {} # device id -> board
+
+    def worker(self, path):
+        return self.ports[path][1]
+
+    def add_board(self, path, device_id, calibration=None, **kwargs):
+        if device_id in self.boards:
+            raise ValueError(f'Board {device_id} is listed twice.')
+        if path not in self.ports:
+            port = serial.Serial(path, **pyrometer.PyrometerSerial.serial_kw_args)
+            self.ports[path] = (port, PortWorker(path, self.depth))
+        port, worker = self.ports[path]
+        board = pyrometer.PyrometerSerial(device_id, port, calibration, **kwargs)
+        board.worker = worker
+        self.boards[device_id] = board
+        return board
+
+    def board(self, device_id):
+        return self.boards[device_id]
+
+    async def run(self, device_id, method, *args, **kwargs):
+        board = self.boards[device_id]
+        return await board.worker.run(getattr(board, method), *args, **kwargs)
+
+    async def stream(self, interval, samples=None, device_ids=None, maxsize=None):
+        """Yield measurements from many boards as they arrive.
+
+        Each board samples on its own schedule into one bounded queue. A
+        consumer that falls behind holds the boards back instead of letting
+        readings pile up. Measurements carry a ``board`` key.
+        """
+        device_ids = list(self.boards) if device_ids is None else device_ids
+        readings = asyncio.Queue(maxsize or self.depth * len(device_ids))
+        tasks = [asyncio.create_task(self.boards[i].sample(samples, interval,
+                                                           queue=readings))
+                 for i in device_ids]
+        finished = asyncio.gather(*tasks)
+        try:
+            while not (finished.done() and readings.empty()):
+                getter = asyncio.ensure_future(readings.get())
+                await asyncio.wait([getter, finished], return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            await finished # Raise errors from the boards
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def close(self):
+        for port, worker in self.ports.values():
+            worker.close()
+            port.close()
@@ -1,38 +1,178 @@
 import logging
-import asyncio
-import time
-from importlib import resources as impresources
+import functools
 import serial
-import yaml
-import numpy as np
-import uw_pyrometer
+from uw_pyrometer import wiretrace, tables
+from uw_pyrometer.stats import RollingStats
+from uw_pyrometer.scheduler import FixedRateScheduler
+from uw_pyrometer.clock import SYSTEM_CLOCK
+from uw_pyrometer.link import LinkTimer, LinkDown
 
 logger = logging.getLogger(__name__)
 
-MEAS_NAMES = ['tr_v', 'temp', 'ref_v', 'tp_v', 'power']
-
-DATA_DIR = impresources.files(uw_pyrometer) / 'data/'
+MEAS_NAMES = ['time', 'tr_v', 'temp', 'ref_v', 'tp_v', 'power', 'flags',
+              'tp_gain', 'tr_gain']
+FLAG_SETTLING = 0x01 # Taken while new or restored gains settle
+FLAG_OUTLIER = 0x02 # Rejected by the set point outlier filter
+FILTER_BLOCK = 32 # Samples per block through sample() filters
+MIN_SAMPLES = 10 # Fewest samples before stopping on precision
+TRACK_MARGIN = 48 # ADC codes from a rail where gain tracking steps in
+TRACK_STEP = 0.125 # Largest fractional gain change per tracking step
+RESET_TIMEOUTS = 3 # Timeouts in a row taken as a board reset
+
+DATA_DIR = tables.DATA_DIR
 DEFAULT_CALIBRATION = DATA_DIR / 'default_calibration.yaml'
 RESPONSIVITY = 5.063e-14 # W / K^4 = G * sigma
 
 
 class PyrometerCalibration:
+    """Calibration constants for one board.
+
+    Calibrations are shared between boards and threads, so they can't be
+    changed once made.
+    """
     __spec__ = ('thermistor_slope', 'thermistor_zero')
+    __slots__ = ('r_zero', 'tp_resp', 'curve_scale')
     ROOM_TEMP = 22.0 # Deg C
 
-    def __init__(self, thermistor_zero, thermopile_resp):
-        self.r_zero = thermistor_zero
-        self.tp_resp = thermopile_resp
+    def __init__(self, thermistor_zero, thermopile_resp, curve_scale=1.0):
+        object.__setattr__(self, 'r_zero', thermistor_zero)
+        object.__setattr__(self, 'tp_resp', thermopile_resp)
+        # log(R/R0) relative to the stock curve
+        object.__setattr__(self, 'curve_scale', curve_scale)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Calibrations are shared; make a new one instead.')
+
+    def __reduce__(self):
+        # Rebuilt through __init__, as pickle and copy can't set attributes
+        return (PyrometerCalibration, (self.r_zero, self.tp_resp, self.curve_scale))
+
+    def __repr__(self):
+        return (f'PyrometerCalibration({self.r_zero!r}, {self.tp_resp!r}, '
+                f'{self.curve_scale!r})')
 
     @staticmethod
     def from_yaml(path):
+        import yaml
+
         # process yaml
         with open(path, encoding='utf8') as f:
             calibration_yaml = yaml.safe_load(f)
+        return PyrometerCalibration.from_dict(calibration_yaml)
+
+    @staticmethod
+    def from_dict(calibration_yaml):
         thermistor_zero = calibration_yaml['thermistor']['room_temp']
         thermopile_resp = calibration_yaml['thermopile']['responsivity']
+        curve_scale = calibration_yaml['thermistor'].get('curve_scale', 1.0)
+
+        return PyrometerCalibration(thermistor_zero, thermopile_resp, curve_scale)
+
+    def to_yaml(self, path, device_id=None):
+        board = '' if device_id is None else f'board:\n  id: {device_id}\n'
+        thermistor = f'  room_temp: {self.r_zero:.2f} # R_th @ 22C\n'
+        if self.curve_scale != 1.0:
+            thermistor += f'  curve_scale: {self.curve_scale:.5f}\n'
+        with open(path, 'w', encoding='utf8') as f:
+            f.write(board + 'thermistor:\n' + thermistor
+                    + f'thermopile:\n  responsivity: {self.tp_resp:.5e} # V/uW\n')
+
+    def thermistor_ratio(self, resistance):
+        """Resistance relative to room temperature on the stock curve."""
+        ratio = resistance / self.r_zero
+        return ratio if self.curve_scale == 1.0 else ratio**(1 / self.curve_scale)
+
+
+@functools.lru_cache(maxsize=None)
+def default_calibration():
+    """The packaged calibration, parsed once and shared."""
+    return PyrometerCalibration.from_yaml(DEFAULT_CALIBRATION)
+
+
+@functools.lru_cache(maxsize=None)
+def thermistor_curve():
+    import numpy as np
+
+    curve = tables.load_table('dc_4007', skip_header=1).copy()
+    # Normalize to room temperature
+    curve[:, 1] /= np.interp(PyrometerCalibration.ROOM_TEMP, curve[:, 0], curve[:, 1])
+    return curve
+
+
+class GainSearch:
+    """The auto gain search for one board, a trial at a time.
 
-        return PyrometerCalibration(thermistor_zero, thermopile_resp)
+    Set the pots to ``trial``, measure, and pass the readings to ``update``
+    until ``done``. ``gains`` are then the best found.
+    """
+
+    MAX_TRIALS = 32
+
+    def __init__(self, start=None):
+        self.tp_gain, self.tr_gain = (20, 20) if start is None else start
+        self.min_error_tp, self.min_error_tr = 1024, 1024
+        self.trial = (self.tp_gain, self.tr_gain)
+        self.trials = 0
+        self.done = False
+
+    @property
+    def gains(self):
+        return self.tp_gain, self.tr_gain
+
+    def update(self, tr, tp):
+        trial_tp_gain, trial_tr_gain = self.trial
+        self.trials += 1
+
+        trial_error_tp = abs(abs(tp-512) - 256)
+        trial_error_tr = abs(tr - 512)
+
+        if trial_error_tp < self.min_error_tp:
+            self.min_error_tp = trial_error_tp
+            self.tp_gain = trial_tp_gain
+
+        if trial_error_tr < self.min_error_tr:
+            self.min_error_tr = trial_error_tr
+            self.tr_gain = trial_tr_gain
+
+        if max(self.min_error_tp, self.min_error_tr) < 64:
+            logger.info('Sufficient value found after %s guesses', self.trials)
+            logger.info('Gains are (%s,%s)', self.tp_gain, self.tr_gain)
+            self.done = True
+            return
+
+        # Guess a better value
+        if tp == 1024:
+            trial_tp_gain = trial_tp_gain*2
+        else:
+            guess = (abs(tp-512) * trial_tp_gain) // 256
+            if guess == trial_tp_gain:
+                trial_tp_gain += -1 if abs(tp-512) < 255 else 1
+            else:
+                trial_tp_gain = guess
+
+        if tr == 1024:
+            trial_tr_gain = trial_tr_gain*2
+        else:
+            guess = (tr * trial_tr_gain) // 512
+            if guess == trial_tr_gain:
+                trial_tr_gain += -1 if tr < 255 else 1
+            else:
+                trial_tr_gain = guess
+
+        trial_tp_gain = max(min(trial_tp_gain, 255), 1)
+        trial_tr_gain = max(min(trial_tr_gain, 255), 1)
+
+        if (trial_tp_gain == self.tp_gain) and (trial_tr_gain == self.tr_gain):
+            logger.info('Most acceptable value found after %s guesses', self.trials)
+            logger.info('Gains are (%s,%s)', self.tp_gain, self.tr_gain)
+            self.done = True
+            return
+
+        logger.debug('Try: (%s, %s)', trial_tp_gain, trial_tr_gain)
+        self.trial = (trial_tp_gain, trial_tr_gain)
+        if self.trials >= self.MAX_TRIALS:
+            logger.warning('Correct gain not found.')
+            self.done = True
 
 
 class PyrometerSerial:
@@ -46,25 +186,46 @@ class PyrometerSerial:
     SYNC_WORD = 0x55
     CMD_SET_POT = 0x01
     CMD_REPORT = 0x00
-    THERMISTOR_CURVE = np.genfromtxt(DATA_DIR / 'dc_4007.csv', delimiter=",", skip_header=1)
-    # Normalize to room temperature
-    THERMISTOR_CURVE[:, 1] /= np.interp(PyrometerCalibration.ROOM_TEMP,
-                                        THERMISTOR_CURVE[:, 0],
-                                        THERMISTOR_CURVE[:, 1])
+    GAIN_SETTLE_TIME = 10.0 # Gain changes take a while to show up
 
-    def __init__(self, device_id, address, calibration=None):
+    def __init__(self, device_id, address, calibration=None, trace=None,
+                 clock=SYSTEM_CLOCK):
         if not 0 <= device_id < 255:
             raise ValueError('Device id must be one byte. '
                              '0xFF is reserved for broadcast.')
 
         self.id = device_id
-        self.serial = serial.Serial(address, **self.serial_kw_args)
+        self.clock = clock
+        if isinstance(address, str):
+            self.serial = serial.Serial(address, **self.serial_kw_args)
+        else:
+            self.serial = address # Already open, e.g. a replay
+        if trace is not None:
+            self.serial = wiretrace.TracedSerial(self.serial, trace, device_id)
         self.pot_thermopile = None
         self.pot_thermistor = None
+        self.gains_lost = False # The board may have reset since gains were set
+        self.settle_until = None
+        self.calibration = calibration
+        self.worker = None # Dedicated I/O thread, see portpool
+        self.link = LinkTimer(self.serial_kw_args['timeout'], clock, f'Board {device_id}')
+
+    @property
+    def calibration(self):
+        if self._registry is not None:
+            return self._registry.get(self.id) # Follows edits to the files
+        return self._calibration
+
+    @calibration.setter
+    def calibration(self, calibration):
+        from uw_pyrometer.registry import CalibrationRegistry, default_registry
+
         if calibration is None:
-            self.calibration = PyrometerCalibration.from_yaml(DEFAULT_CALIBRATION)
+            calibration = default_registry() or default_calibration()
+        if isinstance(calibration, CalibrationRegistry):
+            self._registry, self._calibration = calibration, None
         else:
-            self.calibration = calibration
+            self._registry, self._calibration = None, calibration
 
     def __enter__(self):
         self.open()
@@ -87,38 +248,96 @@ class PyrometerSerial:
             self.read()
 
     def send(self, message, broadcast=False):
-        header = bytes([self.SYNC_WORD, 0xFF if broadcast else self.id])
-        self.serial.write(header)
-        logger.debug('Writing %s', [f'0x{x:02X}' for x in header])
-        self.serial.write(message)
-        logger.debug('Writing %s', [f'0x{x:02X}' for x in message])
+        frame = bytes([self.SYNC_WORD, 0xFF if broadcast else self.id, *message])
+        self.serial.write(frame)
+        logger.debug('Writing %r', frame)
         self.serial.flush()
 
     def read(self, packet_size=7):
         pre_data = self.serial.read_until(bytes([self.SYNC_WORD, self.id]))
-        logger.debug('Read %s', [f'0x{x:02X}' for x in pre_data])
         packet = self.serial.read(packet_size)
-        logger.debug('Read %s', [f'0x{x:02X}' for x in packet])
+        logger.debug('Read %r %r', pre_data, packet)
         if len(packet) != packet_size:
-            # Assume the board has power cycled
-            self.pot_thermopile = None
-            self.pot_thermistor = None
             raise TimeoutError('Packet read timed out.')
         return packet
 
-    def set_gains(self, thermopile_gain, thermistor_gain, broadcast=False):
+    @property
+    def settling(self):
+        return self.settle_until is not None and self.clock.time() < self.settle_until
+
+    def restore_gains(self):
+        """Resend the last gains without waiting; readings settle meanwhile."""
+        self.gains_lost = False
+        if self.pot_thermopile is None or self.pot_thermistor is None:
+            return
+        logger.warning('Board %s answered after a timeout, restoring gains (%s, %s)',
+                       self.id, self.pot_thermopile, self.pot_thermistor)
+        self.send([self.CMD_SET_POT, self.pot_thermopile, self.pot_thermistor])
+        self.settle_until = self.clock.time() + self.GAIN_SETTLE_TIME
+
+    def send_gains(self, thermopile_gain, thermistor_gain, broadcast=False):
+        """Write the pots without waiting for them to settle."""
         if not (0 <= thermopile_gain < 256 and 0 <= thermistor_gain < 256):
             raise ValueError('Gains must be single byte.')
         self.clear()
         self.send([self.CMD_SET_POT, thermopile_gain, thermistor_gain], broadcast)
-        time.sleep(10.0) # Gain changes take a while to show up
         self.pot_thermopile = thermopile_gain
         self.pot_thermistor = thermistor_gain
+        self.gains_lost = False
+
+    def set_gains(self, thermopile_gain, thermistor_gain, broadcast=False):
+        self.send_gains(thermopile_gain, thermistor_gain, broadcast)
+        self.clock.sleep(self.GAIN_SETTLE_TIME)
+        self.settle_until = None
+
+    def adjust_gains(self, thermopile_gain, thermistor_gain):
+        """Change gains without waiting; readings settle meanwhile."""
+        logger.info('Board %s tracking gains (%s, %s) -> (%s, %s)', self.id,
+                    self.pot_thermopile, self.pot_thermistor,
+                    thermopile_gain, thermistor_gain)
+        self.send_gains(thermopile_gain, thermistor_gain)
+        self.settle_until = self.clock.time() + self.GAIN_SETTLE_TIME
+
+    def tracked_gains(self, tr, tp):
+        """Gains moving readings near an ADC rail back in, or None if fine.
+
+        Readings scale inversely with the pots. Each step heads for the
+        auto gain targets but changes a gain by at most ``TRACK_STEP``.
+        """
+        def step(gain, ratio):
+            limit = max(1, round(gain * TRACK_STEP))
+            change = min(max(round(gain * ratio) - gain, -limit), limit)
+            return min(max(gain + change, 1), 255)
+
+        if self.pot_thermopile is None or self.pot_thermistor is None:
+            return None
+        tp_gain, tr_gain = self.pot_thermopile, self.pot_thermistor
+        if abs(tp - 512) > 512 - TRACK_MARGIN:
+            tp_gain = step(tp_gain, abs(tp - 512) / 256)
+        if not TRACK_MARGIN < tr < 1024 - TRACK_MARGIN:
+            tr_gain = step(tr_gain, tr / 512)
+        if (tp_gain, tr_gain) == (self.pot_thermopile, self.pot_thermistor):
+            return None
+        return tp_gain, tr_gain
 
     def get_measurement(self, broadcast=False):
+        self.link.check()
         self.clear()
+        if self.serial.timeout != self.link.timeout:
+            self.serial.timeout = self.link.timeout
+        start = self.clock.time()
         self.send(bytes([self.CMD_REPORT]), broadcast)
-        packet = self.read(7)
+        try:
+            packet = self.read(7)
+        except TimeoutError:
+            self.link.failure()
+            if self.link.failures >= RESET_TIMEOUTS:
+                # Silent long enough to have power cycled, so restore gains once it answers
+                self.gains_lost = True
+            raise
+        self.link.success(self.clock.time() - start)
+        if self.gains_lost:
+            self.restore_gains()
 
         if packet[0] != self.CMD_REPORT:
             logger.warning('Response echoed command %s instead of %s',
@@ -137,22 +356,28 @@ class PyrometerSerial:
         return reference, thermistor, thermopile
 
     def thermistor_temperature(self, thermistor_voltage):
+        import numpy as np
+
         if self.pot_thermistor is None:
             raise RuntimeError('Potentiometer not set.')
 
-        pre_amp_voltage = self.pot_thermistor * thermistor_voltage / 255
-        resistance = 2.2e6 / (5.0/pre_amp_voltage - 1.) # R_T / R4
+        resistance = self.thermistor_resistance(thermistor_voltage, self.pot_thermistor)
 
         logger.debug('Resistance %s', resistance)
-        if not (self.THERMISTOR_CURVE[-1, 1] < resistance/self.calibration.r_zero < self.THERMISTOR_CURVE[0, 1]):
+        curve = thermistor_curve()
+        ratio = self.calibration.thermistor_ratio(resistance)
+        if not np.all((curve[-1, 1] < ratio) & (ratio < curve[0, 1])):
             logger.warning('Thermistor temperature is out of calibration range')
 
-        temperature = np.interp(resistance/self.calibration.r_zero,
-                                self.THERMISTOR_CURVE[::-1, 1],
-                                self.THERMISTOR_CURVE[::-1, 0])
+        temperature = np.interp(ratio, curve[::-1, 1], curve[::-1, 0])
         # temperature = (resistance / self.calibration.r_zero - 1) / self.calibration.r_slope
         return temperature
 
+    @staticmethod
+    def thermistor_resistance(thermistor_voltage, gain):
+        pre_amp_voltage = gain * thermistor_voltage / 255
+        return 2.2e6 / (5.0/pre_amp_voltage - 1.) # R_T / R4
+
     def thermopile_power(self, thermopile_voltage, reference_voltage=2.5):
         pre_amp_voltage = self.thermopile_voltage(thermopile_voltage, reference_voltage)
         power = pre_amp_voltage / self.calibration.tp_resp
@@ -167,116 +392,193 @@ class PyrometerSerial:
     def adc_to_voltage(adc_value):
         return (adc_value * 5)/1024.
 
-    def auto_gain(self, start=None):
-        tp_gain, tr_gain = (20, 20) if start is None else start
-
-        min_error_tp, min_error_tr = 1024, 1024
-
-        trial_tp_gain = tp_gain
-        trial_tr_gain = tr_gain
-
-        for gain_n in range(32):
-            self.set_gains(trial_tp_gain, trial_tr_gain)
-
-            for i in range(4): # 4 retries on timeout
-                try:
-                    _, tr, tp = self.get_measurement()
-                    break
-                except TimeoutError:
-                    logger.warning('Read timed out')
-                    continue
-            else:
-                raise TimeoutError('Timed out on max attempts')
-
-            trial_error_tp = abs(abs(tp-512) - 256)
-            trial_error_tr = abs(tr - 512)
-
-            if trial_error_tp < min_error_tp:
-                min_error_tp = trial_error_tp
-                tp_gain = trial_tp_gain
-
-            if trial_error_tr < min_error_tr:
-                min_error_tr = trial_error_tr
-                tr_gain = trial_tr_gain
-
-            if max(min_error_tp, min_error_tr) < 64:
-                logger.info('Sufficient value found after %s guesses', gain_n+1)
-                logger.info('Gains are (%s,%s)', tp_gain, tr_gain)
-                break
-
-            # Guess a better value
-            if tp == 1024:
-                trial_tp_gain = trial_tp_gain*2
-            else:
-                guess = (abs(tp-512) * trial_tp_gain) // 256
-                if guess == trial_tp_gain:
-                    trial_tp_gain += -1 if abs(tp-512) < 255 else 1
-                else:
-                    trial_tp_gain = guess
-                    
-
-            if tr == 1024:
-                trial_tr_gain = trial_tr_gain*2
-            else:
-                guess = (tr * trial_tr_gain) // 512
-                if guess == trial_tr_gain:
-                    trial_tr_gain += -1 if tr < 255 else 1
-                else:
-                    trial_tr_gain = guess
-
-            trial_tp_gain = max(min(trial_tp_gain, 255), 1)
-            trial_tr_gain = max(min(trial_tr_gain, 255), 1)
-
-            if (trial_tp_gain == tp_gain) and (trial_tr_gain == tr_gain):
-                logger.info('Most acceptable value found after %s guesses', gain_n+1)
-                logger.info('Gains are (%s,%s)', tp_gain, tr_gain)
-                break
-
-            logger.debug('Try: (%s, %s)', trial_tp_gain, trial_tr_gain)
-        else:
-            logger.warning('Correct gain not found.')
-
-        self.set_gains(tp_gain, tr_gain)
+    def measure_retrying(self, attempts=4):
+        for _ in range(attempts):
+            try:
+                return self.get_measurement()
+            except TimeoutError:
+                logger.warning('Read timed out')
+        raise TimeoutError('Timed out on max attempts')
 
-        return tp_gain, tr_gain
+    def auto_gain(self, start=None):
+        search = GainSearch(start)
+        while not search.done:
+            self.set_gains(*search.trial)
+            _, tr, tp = self.measure_retrying()
+            search.update(tr, tp)
+
+        self.set_gains(*search.gains)
+        return search.gains
+
+    async def run_io(self, func, *args):
+        """Run blocking serial I/O off the event loop."""
+        import asyncio
+
+        if self.worker is not None:
+            return await self.worker.run(func, *args)
+        return await asyncio.to_thread(func, *args)
+
+    async def sample(self, samples, interval, complete=None, updater_f=None,
+                     history=None, ring=None, queue=None, filters=None,
+                     filter_block=FILTER_BLOCK, filtered_f=None,
+                     precision=None, min_samples=MIN_SAMPLES, track_gains=False):
+        """Sample until complete, returning the mean of each measurement.
+
+        Sampling stops after ``samples`` readings, or once ``complete`` is
+        set. With ``samples`` None it runs until ``complete`` is set or the
+        task is cancelled, as on Ctrl-C.
+
+        ``filters`` maps measurement names to filter stages (see filters);
+        those means are taken over the filtered stream. Unflagged samples go
+        through in blocks of ``filter_block``, and ``filtered_f`` is called
+        with each block's output, by name.
+
+        ``precision`` maps measurement names to a target standard error of
+        the mean. Sampling then stops once every target is met, after at
+        least ``min_samples``, with ``samples`` as the upper bound.
+
+        With ``track_gains``, a reading near an ADC rail nudges the gains
+        (see tracked_gains). Samples are flagged while the new gains settle,
+        and every sample keeps the gains it was converted with.
+        """
+        import asyncio
 
-    async def sample(self, samples, interval, complete=None, updater_f=None):
         if complete is None:
             complete = asyncio.Event()
 
-        sample_history = {x: [] for x in MEAS_NAMES}
+        sample_stats = {x: RollingStats() for x in MEAS_NAMES}
+        filters = filters or {}
+        pending = {key: [] for key in filters}
+
+        def run_filters():
+            block = {}
+            for key, stage in filters.items():
+                block[key] = stage.process(pending[key])
+                sample_stats[key].extend(block[key])
+                pending[key] = [] # A stage may hand back the block it was given
+            if filtered_f is not None:
+                filtered_f(block)
+        scheduler = FixedRateScheduler(interval, self.clock)
 
         samples_taken = 0
         while not complete.is_set():
+            await scheduler.wait()
+            start = self.clock.time()
             try:
-                ref, tr, tp = await asyncio.to_thread(self.get_measurement)
+                ref, tr, tp = await self.run_io(self.get_measurement)
+            except LinkDown:
+                continue # Already logged when the link went down
             except TimeoutError:
                 logger.warning('Read timed out')
                 continue
+            # Stamp the middle of the request and reply
+            acquired = (start + self.clock.time()) / 2
 
-            # Increment measurement counter
-            samples_taken += 1
-            if samples_taken >= samples:
+            flags = FLAG_SETTLING if self.settling else 0
+            if not flags: # Flagged samples don't count toward the total
+                samples_taken += 1
+            if samples is not None and samples_taken >= samples:
                 complete.set() # Done measuring
 
             tr_v = self.adc_to_voltage(tr)
-            sample_history['tr_v'].append(tr_v)
-            temp = self.thermistor_temperature(tr_v)
-            sample_history['temp'].append(temp)
-
             tp_v = self.adc_to_voltage(tp)
-            sample_history['tp_v'].append(tp_v)
             ref_v = self.adc_to_voltage(ref)
-            sample_history['ref_v'].append(ref_v)
-
-            power = self.thermopile_power(tp_v, ref_v)
-            sample_history['power'].append(power)
+            measurement = {'time': acquired,
+                           'tr_v': tr_v,
+                           'temp': self.thermistor_temperature(tr_v),
+                           'ref_v': ref_v,
+                           'tp_v': tp_v,
+                           'power': self.thermopile_power(tp_v, ref_v),
+                           'flags': flags,
+                           'tp_gain': self.pot_thermopile,
+                           'tr_gain': self.pot_thermistor}
+            for key, value in measurement.items():
+                if not flags: # Flagged samples are kept but not averaged
+                    if key in pending:
+                        pending[key].append(value)
+                    else:
+                        sample_stats[key].add(value)
+                if history is not None:
+                    history[key].append(value)
+            if track_gains and not self.settling:
+                gains = self.tracked_gains(tr, tp)
+                if gains is not None:
+                    await self.run_io(self.adjust_gains, *gains)
+            if filters and len(pending[next(iter(filters))]) >= filter_block:
+                run_filters()
+            if (precision and samples_taken >= min_samples
+                    and all(sample_stats[k].sem <= v for k, v in precision.items())):
+                complete.set() # Precise enough, stop early
+            if ring is not None:
+                # Published inline; ring readers never hold up sampling
+                ring.publish(time=acquired, board=self.id, flags=flags,
+                             tp_gain=self.pot_thermopile, tr_gain=self.pot_thermistor,
+                             ref=ref, tr=tr, tp=tp,
+                             temp=measurement['temp'], power=measurement['power'])
+
+            if queue is not None:
+                await queue.put({'board': self.id, **measurement}) # Waits if the reader is behind
 
             if updater_f is not None:
-                # Call an updater for a progress indicator
-                await asyncio.to_thread(updater_f, sample_history)
-
-            if not complete.is_set():
-                await asyncio.sleep(interval)
-
-        return {k: sum(v)/len(v) for k, v in sample_history.items()}
+                # Called inline, so keep it quick; see display.LiveDisplay
+                updater_f(measurement)
+
+        if filters:
+            run_filters()
+        if scheduler.missed:
+            logger.warning('%s sample deadlines missed', scheduler.missed)
+        if precision:
+            logger.info('Stopped after %s samples with standard errors %s', samples_taken,
+                        ', '.join(f'{k} {sample_stats[k].sem:.3g}' for k in precision))
+        return {k: v.mean for k, v in sample_stats.items()}
+
+
+def write_gains(boards, gains, broadcast=False):
+    """Write each board's pots back to back, then settle once for all.
+
+    With ``broadcast`` the boards are the whole bus, so gains they all share
+    go out in a single broadcast frame.
+    """
+    if broadcast and len(set(gains)) == 1:
+        boards[0].send_gains(*gains[0], broadcast=True)
+        for board in boards[1:]:
+            board.pot_thermopile, board.pot_thermistor = gains[0]
+            board.gains_lost = False
+    else:
+        for board, board_gains in zip(boards, gains):
+            board.send_gains(*board_gains)
+    boards[0].clock.sleep(PyrometerSerial.GAIN_SETTLE_TIME)
+    for board in boards:
+        board.settle_until = None
+
+
+def fleet_auto_gain(boards, starts=None, broadcast=False):
+    """Auto gain boards on one bus together, sharing every settle wait.
+
+    Each round writes the trial gains of every board still searching and
+    waits once, so the time taken hardly grows with the number of boards.
+    ``broadcast`` says the boards are all there is on the bus; a round
+    where they all try the same gains is then one broadcast frame.
+    """
+    starts = [None] * len(boards) if starts is None else starts
+    searches = [GainSearch(start) for start in starts]
+    rounds = 0
+    while not all(search.done for search in searches):
+        active = [(board, search) for board, search in zip(boards, searches)
+                  if not search.done]
+        write_gains([board for board, _ in active], [search.trial for _, search in active],
+                    broadcast and len(active) == len(boards))
+        rounds += 1
+        for board, search in active:
+            _, tr, tp = board.measure_retrying()
+            search.update(tr, tp)
+
+    # Boards left on a trial that wasn't their best
+    final = [(board, search.gains) for board, search in zip(boards, searches)
+             if (board.pot_thermopile, board.pot_thermistor) != search.gains]
+    if final:
+        write_gains([board for board, _ in final], [gains for _, gains in final],
+                    broadcast and len(final) == len(boards))
+        rounds += 1
+    logger.info('%s boards gained in %s settles', len(boards), rounds)
+    return [search.gains for search in searches]
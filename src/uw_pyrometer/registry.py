@@ -0,0 +1,111 @@
+import os
+import logging
+import functools
+import threading
+from pathlib import Path
+from uw_pyrometer import pyrometer
+from uw_pyrometer.clock import SYSTEM_CLOCK
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_ENV = 'UW_PYROMETER_CALIBRATIONS'
+
+
+class CalibrationRegistry:
+    """Calibrations for many boards, loaded from a directory of yaml files.
+
+    A file applies to the board ids and serial numbers listed under its
+    optional ``board`` key, and always to its own name, read as a board id
+    when it is a number::
+
+        board:
+          id: 13
+          serial: A10K3Z
+        thermistor:
+          room_temp: 31_500
+
+    Files are parsed once. Lookups check the directory at most every
+    ``CHECK_INTERVAL`` seconds and reparse only files whose mtime changed, so
+    a long running process follows edits without restarting. Boards with no
+    file get the default calibration.
+    """
+
+    CHECK_INTERVAL = 1.0 # Seconds
+
+    def __init__(self, directory, default=None, clock=SYSTEM_CLOCK):
+        self.directory = Path(directory)
+        self.default = pyrometer.default_calibration() if default is None else default
+        self.clock = clock
+        self._files = {} # path -> (mtime, size, calibration, keys)
+        self._index = {}
+        self._checked = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    @staticmethod
+    def load(path):
+        import yaml
+
+        with open(path, encoding='utf8') as f:
+            calibration_yaml = yaml.safe_load(f)
+        board = calibration_yaml.get('board') or {}
+        keys = [int(path.stem) if path.stem.isdigit() else path.stem]
+        for key, kind in (('id', int), ('serial', str)):
+            values = board.get(key, [])
+            keys.extend(kind(v) for v in (values if isinstance(values, list) else [values]))
+        return pyrometer.PyrometerCalibration.from_dict(calibration_yaml), keys
+
+    def refresh(self):
+        """Reparse new or changed files and forget removed ones."""
+        import yaml
+
+        with self._lock:
+            files = {}
+            for path in sorted(self.directory.glob('*.yaml')):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue # Removed while scanning
+                entry = self._files.get(path)
+                if entry is None or entry[:2] != (stat.st_mtime_ns, stat.st_size):
+                    try:
+                        entry = (stat.st_mtime_ns, stat.st_size, *self.load(path))
+                        logger.info('Loaded calibration %s', path)
+                    except (OSError, KeyError, TypeError, ValueError,
+                            AttributeError, yaml.YAMLError) as exp:
+                        # Keep the last good version, e.g. while a file is half written
+                        logger.warning('Could not load calibration %s: %s', path, exp)
+                        if entry is None:
+                            continue
+                files[path] = entry
+
+            index = {}
+            for path, (_, _, calibration, keys) in files.items():
+                for key in keys:
+                    if key in index and index[key] is not calibration:
+                        logger.warning('Calibration %s given more than once', key)
+                    index[key] = calibration
+            self._files, self._index = files, index
+            self._checked = self.clock.time()
+
+    def get(self, key):
+        """Calibration for a board id or serial number."""
+        if self.clock.time() - self._checked >= self.CHECK_INTERVAL:
+            self.refresh()
+        return self._index.get(key, self.default)
+
+    def __contains__(self, key):
+        return key in self._index
+
+
+@functools.lru_cache(maxsize=None)
+def registry_for(directory):
+    return CalibrationRegistry(directory)
+
+
+def default_registry():
+    """Registry for the directory in $UW_PYROMETER_CALIBRATIONS, if set."""
+    directory = os.environ.get(REGISTRY_ENV)
+    if not directory:
+        return None
+    return registry_for(os.path.abspath(directory))
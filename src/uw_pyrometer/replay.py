@@ -0,0 +1,178 @@
+import json
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from uw_pyrometer import wiretrace, pyrometer, omega_controller
+
+logger = logging.getLogger(__name__)
+
+IDLE_WAIT = 0.002 # Real seconds without traffic before virtual time jumps
+
+
+class ReplaySession:
+    """Serve a wire trace back to the drivers that recorded it.
+
+    The session is also the clock handed to ``PyrometerSerial`` and
+    ``emissivity.run_temps``. With ``speed`` set, sleeps run that many times
+    faster than real time. Without it, time is virtual: replies move the clock
+    to their recorded time and an idle sleeper jumps straight to its deadline.
+    """
+
+    def __init__(self, path, speed=None):
+        self.speed = speed
+        self.channels = {}
+        self.notes = []
+        for timestamp, channel, direction, data in wiretrace.read_trace(path):
+            if direction == wiretrace.NOTE:
+                self.notes.append(json.loads(data))
+            else:
+                self.channels.setdefault(channel, []).append((timestamp, direction, data))
+
+        self.now = 0.0
+        self.real_start = time.monotonic()
+        self.traffic = 0 # Bumped on every served reply
+        self.sleepers = []
+        self.sleeper_ids = itertools.count()
+
+    @property
+    def metadata(self):
+        merged = {}
+        for note in self.notes:
+            merged.update(note)
+        return merged
+
+    def port(self, channel):
+        return ReplaySerial(self, self.channels.get(channel, []))
+
+    def advance(self, timestamp):
+        self.now = max(self.now, timestamp)
+        self.traffic += 1
+
+    def time(self):
+        if self.speed is not None:
+            return (time.monotonic() - self.real_start) * self.speed
+        return self.now
+
+    def sleep(self, delay):
+        if self.speed is not None:
+            time.sleep(delay / self.speed)
+        else:
+            self.now += delay
+
+    async def async_sleep(self, delay):
+        if self.speed is not None:
+            await asyncio.sleep(delay / self.speed)
+            return
+
+        target = self.now + delay
+        key = (target, next(self.sleeper_ids))
+        heapq.heappush(self.sleepers, key)
+        try:
+            while self.now < target:
+                traffic = self.traffic
+                await asyncio.sleep(IDLE_WAIT)
+                if self.traffic == traffic and self.sleepers[0] == key:
+                    # Nothing else is moving the clock, so skip ahead.
+                    self.now = target
+        finally:
+            self.sleepers.remove(key)
+            heapq.heapify(self.sleepers)
+
+
+class ReplaySerial:
+    """Serial port stand-in that answers writes with recorded replies.
+
+    Writes are matched against the recorded requests in order. Repeated polls
+    the replay no longer makes are skipped, and extra polls get the last reply
+    to the same request again, so timing driven loops stay in step.
+    """
+
+    def __init__(self, session, records):
+        self.session = session
+        self.records = records
+        self.cursor = 0
+        self.buffer = bytearray()
+        self.served = {}
+        self.timeout = None
+        self.is_open = True
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def flush(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        return len(self.buffer)
+
+    def write(self, data):
+        data = bytes(data)
+        index = self.cursor
+        while index < len(self.records):
+            _, direction, recorded = self.records[index]
+            if direction == wiretrace.TX:
+                if recorded == data:
+                    break
+                if recorded not in self.served:
+                    index = len(self.records) # Never skip a new request
+                    break
+            index += 1
+
+        if index >= len(self.records):
+            logger.debug('No recorded reply for %r', data)
+            self.buffer += self.served.get(data, b'')
+            return len(data)
+
+        reply = bytearray()
+        last_time = self.records[index][0]
+        self.cursor = index + 1
+        while self.cursor < len(self.records):
+            timestamp, direction, recorded = self.records[self.cursor]
+            if direction == wiretrace.TX:
+                break
+            reply += recorded
+            last_time = timestamp
+            self.cursor += 1
+
+        if self.session.speed is not None:
+            lag = last_time - self.session.time()
+            if lag > 0:
+                time.sleep(lag / self.session.speed)
+        self.session.advance(last_time)
+        self.served[data] = bytes(reply)
+        self.buffer += reply
+        return len(data)
+
+    def _take(self, size):
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def read(self, size=1):
+        return self._take(size)
+
+    def read_until(self, expected=b'\n', size=None):
+        end = self.buffer.find(expected)
+        end = len(self.buffer) if end < 0 else end + len(expected)
+        if size is not None:
+            end = min(end, size)
+        return self._take(end)
+
+    def readline(self, size=None):
+        return self.read_until(b'\n', size)
+
+
+def replay_pyrometer(session, device_id, calibration=None):
+    return pyrometer.PyrometerSerial(device_id, session.port(device_id),
+                                     calibration, clock=session)
+
+
+def replay_controller(session):
+    return omega_controller.omega_pid(port=session.port(omega_controller.TRACE_CHANNEL),
+                                      open_delay=0)
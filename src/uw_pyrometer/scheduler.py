@@ -0,0 +1,49 @@
+import logging
+from uw_pyrometer.clock import SYSTEM_CLOCK
+
+logger = logging.getLogger(__name__)
+
+
+class FixedRateScheduler:
+    """Pace a loop on absolute deadlines ``start + n * interval``.
+
+    Time spent acquiring does not push later samples back, so the rate holds
+    on average. A tick that is late by less than an interval fires at once;
+    later than that, the missed ticks are counted and skipped so the loop
+    keeps its phase instead of bursting to catch up.
+    """
+
+    def __init__(self, interval, clock=SYSTEM_CLOCK):
+        self.interval = interval
+        self.clock = clock
+        self.start = None
+        self.tick = 0
+        self.missed = 0
+
+    def _delay(self):
+        now = self.clock.time()
+        if self.start is None:
+            self.start = now
+            return 0.0
+
+        self.tick += 1
+        deadline = self.start + self.tick * self.interval
+        late = now - deadline
+        if late >= self.interval:
+            skipped = int(late // self.interval)
+            self.tick += skipped
+            self.missed += skipped
+            logger.warning('Missed %s sample deadlines, %.3f s behind',
+                           skipped, late)
+            deadline = self.start + self.tick * self.interval
+        return max(deadline - now, 0.0)
+
+    async def wait(self):
+        delay = self._delay()
+        if delay > 0:
+            await self.clock.async_sleep(delay)
+
+    def wait_sync(self):
+        delay = self._delay()
+        if delay > 0:
+            self.clock.sleep(delay)
@@ -0,0 +1,120 @@
+import sys
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+
+SAMPLE_DTYPE = np.dtype([('seq', '<u8'),
+                         ('time', '<f8'),
+                         ('board', 'u1'),
+                         ('flags', 'u1'),
+                         ('tp_gain', 'u1'),
+                         ('tr_gain', 'u1'),
+                         ('ref', '<u2'),
+                         ('tr', '<u2'),
+                         ('tp', '<u2'),
+                         ('temp', '<f8'),
+                         ('power', '<f8')])
+HEADER_DTYPE = np.dtype([('magic', 'S8'),
+                         ('capacity', '<u8'),
+                         ('write_seq', '<u8'),
+                         ('record_size', '<u8')])
+MAGIC = b'UWPRING1'
+HEADER_SIZE = 64 # Keeps the records cache line aligned
+
+_created: set[str] = set() # Rings owned by this process
+
+
+class SampleRing:
+    """Fixed-dtype sample records in a shared memory ring.
+
+    One process publishes; any number of local processes attach and poll.
+    Readers never block the writer. Each record carries a sequence number, so
+    a reader that falls more than a ring behind knows how many it lost.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((), HEADER_DTYPE, shm.buf, 0)
+        if self.header['magic'] != MAGIC:
+            raise ValueError(f'{shm.name} is not a sample ring.')
+        if self.header['record_size'] != SAMPLE_DTYPE.itemsize:
+            raise ValueError('Sample ring record layout does not match.')
+        self.capacity = int(self.header['capacity'])
+        self.records = np.ndarray((self.capacity,), SAMPLE_DTYPE, shm.buf, HEADER_SIZE)
+
+    @classmethod
+    def create(cls, name=None, capacity=4096):
+        size = HEADER_SIZE + capacity * SAMPLE_DTYPE.itemsize
+        shm = shared_memory.SharedMemory(name, create=True, size=size)
+        header = np.ndarray((), HEADER_DTYPE, shm.buf, 0)
+        header[()] = (MAGIC, capacity, 0, SAMPLE_DTYPE.itemsize)
+        del header
+        _created.add(shm.name)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        # Only the creator should unlink the block on exit
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name, track=False)
+        else:
+            shm = shared_memory.SharedMemory(name)
+            if shm.name not in _created:
+                resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def write_seq(self):
+        return int(self.header['write_seq'])
+
+    def publish(self, **fields):
+        seq = self.write_seq
+        record = self.records[seq % self.capacity]
+        record['seq'] = np.iinfo(np.uint64).max # Mark as being written
+        for key, value in fields.items():
+            record[key] = value
+        record['seq'] = seq
+        self.header['write_seq'] = seq + 1
+        return seq
+
+    def close(self):
+        del self.header, self.records
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+            _created.discard(self.shm.name)
+
+
+class RingReader:
+    def __init__(self, ring, from_start=False):
+        self.ring = ring
+        self.next_seq = 0 if from_start else ring.write_seq
+        self.lost = 0
+
+    def poll(self):
+        """Return copies of the records published since the last poll.
+
+        Records are checked as a seqlock: the writer marks a record before
+        changing it, so a copy is kept only if its sequence number is the
+        expected one both in the copy and in the ring after copying.
+        """
+        end = self.ring.write_seq
+        start = max(self.next_seq, end - self.ring.capacity)
+        self.lost += start - self.next_seq
+        if end <= start:
+            return np.empty(0, SAMPLE_DTYPE)
+
+        index = np.arange(start, end) % self.ring.capacity
+        records = self.ring.records[index] # Fancy indexing copies
+        after = self.ring.records['seq'][index]
+
+        # Drop records the writer reused while they were being copied
+        expected = np.arange(start, end, dtype=np.uint64)
+        valid = (records['seq'] == expected) & (after == expected)
+        self.lost += int(np.count_nonzero(~valid))
+        self.next_seq = end
+        return records[valid]
@@ -0,0 +1,126 @@
+import math
+import bisect
+from collections import deque
+
+
+class RollingStats:
+    """Mean, spread and extremes over the last ``window`` values.
+
+    Every update is O(1) (amortized for min and max) and memory is bounded by
+    the window. A window of None keeps statistics over every value added
+    without storing them. The median needs a sorted copy of the window, so
+    it is only tracked when asked for.
+    """
+
+    def __init__(self, window=None, median=False):
+        if window is not None and window < 1:
+            raise ValueError('Window must be at least one value.')
+        if median and window is None:
+            raise ValueError('Median needs a bounded window.')
+
+        self.window = window
+        self.total = 0 # Values seen, including those out of the window
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._values = deque() if window is not None else None
+        self._min = deque() # (index, value), increasing values
+        self._max = deque() # (index, value), decreasing values
+        self._sorted = [] if median else None
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value):
+        index = self.total
+        self.total += 1
+
+        if self._values is not None:
+            self._values.append(value)
+            if len(self._values) > self.window:
+                self._remove(self._values.popleft())
+
+        # Welford update
+        self.count += 1
+        delta = value - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (value - self._mean)
+
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        if self.window is None:
+            # Nothing expires, so only the extremes are worth keeping
+            if not self._min:
+                self._min.append((index, value))
+            if not self._max:
+                self._max.append((index, value))
+        else:
+            self._min.append((index, value))
+            self._max.append((index, value))
+            oldest = self.total - self.window
+            if self._min[0][0] < oldest:
+                self._min.popleft()
+            if self._max[0][0] < oldest:
+                self._max.popleft()
+
+        if self._sorted is not None:
+            bisect.insort(self._sorted, value)
+
+    def _remove(self, value):
+        self.count -= 1
+        if self.count == 0:
+            self._mean, self._m2 = 0.0, 0.0
+        else:
+            delta = value - self._mean
+            self._mean -= delta / self.count
+            self._m2 -= delta * (value - self._mean)
+            self._m2 = max(self._m2, 0.0) # Guard against rounding
+
+        if self._sorted is not None:
+            del self._sorted[bisect.bisect_left(self._sorted, value)]
+
+    def extend(self, values):
+        for value in values:
+            self.add(value)
+
+    @property
+    def mean(self):
+        if self.count == 0:
+            return math.nan
+        return self._mean
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return math.nan
+        return self._m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def sem(self):
+        """Standard error of the mean."""
+        return self.std / math.sqrt(self.count) if self.count else math.nan
+
+    @property
+    def min(self):
+        return self._min[0][1] if self._min else math.nan
+
+    @property
+    def max(self):
+        return self._max[0][1] if self._max else math.nan
+
+    @property
+    def median(self):
+        if self._sorted is None:
+            raise RuntimeError('Median is not tracked.')
+        if not self._sorted:
+            return math.nan
+        middle = len(self._sorted) // 2
+        if len(self._sorted) % 2:
+            return self._sorted[middle]
+        return (self._sorted[middle - 1] + self._sorted[middle]) / 2
@@ -0,0 +1,47 @@
+import os
+import hashlib
+import logging
+import functools
+from pathlib import Path
+from importlib import resources as impresources
+import uw_pyrometer
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = impresources.files(uw_pyrometer) / 'data/'
+CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'uw_pyrometer'
+
+
+@functools.lru_cache(maxsize=None)
+def load_table(name, skip_header=0):
+    """Load ``data/<name>.csv`` as an array, parsing the csv only once.
+
+    The parsed table is cached as ``.npy`` keyed on a hash of the csv and
+    the rows skipped, so an edited table is picked up and a read-only
+    install still works. Every caller gets the same array, so it is read
+    only; copy it to make changes.
+    """
+    import numpy as np
+
+    source = (DATA_DIR / f'{name}.csv').read_bytes()
+    digest = hashlib.sha1(source).hexdigest()[:16]
+    cache_path = CACHE_DIR / f'{name}-skip{skip_header}-{digest}.npy'
+    try:
+        table = np.load(cache_path)
+        table.flags.writeable = False
+        return table
+    except (OSError, ValueError):
+        pass
+
+    lines = source.decode('utf8').splitlines()[skip_header:]
+    table = np.loadtxt(lines, delimiter=',', ndmin=2)
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        partial_path = cache_path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(partial_path, 'wb') as f:
+            np.save(f, table)
+        os.replace(partial_path, cache_path)
+    except OSError as exp:
+        logger.debug('Could not cache %s: %s', name, exp)
+    table.flags.writeable = False
+    return table
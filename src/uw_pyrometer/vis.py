@@ -0,0 +1,160 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from uw_pyrometer import pyrometer
+from uw_pyrometer.emissivity import bandpass, to_k
+
+
+class EmissivityVis(plt.Figure):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.make_emissivity_ax()
+
+    def set_txlim(self, l_lim, r_lim):
+        k = pyrometer.RESPONSIVITY * bandpass(22.0)
+        x_lim = [1e6*k*to_k(x)**4 for x in (l_lim, r_lim)]
+        self.ax.set_xlim(*x_lim)
+
+    def make_emissivity_ax(self):
+        self.ax = self.add_subplot(111)
+        self.ax.set_xlabel(r'Blackbody Power (\si{\micro\watt})')
+        self.ax.set_ylabel(r'Total Received Power (\si{\micro\watt})')
+        self.set_txlim(15, 130)
+        self.ax.set_ylim(*self.ax.get_xlim())
+        # Fig should be created with
+        self.scatter = self.ax.scatter([], [])
+        self.fit, = self.ax.plot([], [], ls=':')
+        self.fit_band = [self.ax.plot([], [], ls=':', lw=0.5, color=self.fit.get_color())[0]
+                         for _ in range(2)]
+
+        self.label = self.ax.annotate('No Data', (.47, .52), (.15, .7),
+                                      xycoords='axes fraction',
+                                      arrowprops=dict(facecolor='black',
+                                                      width=0.1, headwidth=4,
+                                                      headlength=6, shrink=.05))
+    def update_emissivity(self, x, y, bg, e, cov=None):
+        self.scatter.set_offsets(np.c_[1e6*x, 1e6*y])
+
+        fit_x = np.linspace(*self.ax.get_xlim(), 100)
+        fit_y = e * fit_x + bg*1e6
+        self.fit.set_xdata(fit_x)
+        self.fit.set_ydata(fit_y)
+
+        e_text, bg_text = f'{e:.3f}', f'{1e6*bg:.1f}'
+        if cov is not None and np.all(np.isfinite(cov)):
+            # One sigma band: var(bg + e x) = var_bg + x^2 var_e + 2 x cov
+            band = 1e6*np.sqrt(np.maximum(cov[1, 1] + (1e-6*fit_x)**2 * cov[0, 0]
+                                          + 2e-6*fit_x * cov[0, 1], 0))
+            for line, sign in zip(self.fit_band, (1, -1)):
+                line.set_data(fit_x, fit_y + sign*band)
+            e_text += rf' \pm {np.sqrt(cov[0, 0]):.3f}'
+            bg_text += rf' \pm {1e6*np.sqrt(cov[1, 1]):.1f}'
+        else:
+            for line in self.fit_band:
+                line.set_data([], [])
+
+        self.label.set_text(r' $ \SI{' + e_text + r'}{} \sigma T^4 + \SI{' + bg_text + r'}{\micro\watt} $')
+
+        self.ax.set_ylim([1e6*bg+e*x for x in self.ax.get_xlim()])
+        # self.label.set_position((fit_x[65], e * fit_x[65] + 1e6*bg))
+
+
+class LivePlot:
+    """Draw emissivity updates in a separate process.
+
+    ``update_emissivity`` queues the newest fit in place of the oldest when
+    the plot is behind, so the acquisition loop never waits on the GUI and
+    the last fit always arrives. The plot process redraws the animated artists
+    with blitting and only does a full draw when the axes limits change.
+    """
+
+    REFRESH = 0.05 # Seconds between GUI event loop turns
+
+    def __init__(self, style=None):
+        import multiprocessing
+
+        context = multiprocessing.get_context('spawn')
+        self.queue = context.Queue(maxsize=4)
+        self.process = context.Process(target=live_plot_loop,
+                                       args=(self.queue, style),
+                                       daemon=True)
+        self.process.start()
+
+    def put_latest(self, item):
+        """Queue item without waiting, dropping the oldest if the plot is behind."""
+        import queue
+
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                pass
+            try:
+                self.queue.get_nowait() # Superseded by item
+            except queue.Empty:
+                pass
+
+    def update_emissivity(self, x, y, bg, e, cov=None):
+        self.put_latest((np.asarray(x), np.asarray(y), bg, e, cov))
+
+    def close(self, wait=True):
+        """Stop updating. With wait, block until the window is closed."""
+        if self.process.is_alive(): # The window may already be closed
+            self.put_latest(None)
+        if wait:
+            self.process.join()
+
+
+def live_plot_loop(updates, style):
+    import queue
+    import time
+
+    if style is not None:
+        plt.style.use(style)
+    fig = plt.figure(FigureClass=EmissivityVis)
+    artists = [fig.scatter, fig.fit, *fig.fit_band, fig.label]
+    for artist in artists:
+        artist.set_animated(True)
+
+    plt.show(block=False)
+    canvas = fig.canvas
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+    limits = fig.ax.get_ylim()
+
+    while plt.fignum_exists(fig.number):
+        latest, done = None, False
+        try:
+            while not done: # Only the newest update matters
+                update = updates.get_nowait()
+                if update is None:
+                    done = True
+                else:
+                    latest = update
+        except queue.Empty:
+            pass
+
+        if latest is not None: # Drawn even when it came with the end
+            fig.update_emissivity(*latest)
+            if fig.ax.get_ylim() != limits:
+                # Axes moved, so the saved background is stale
+                for artist in artists:
+                    artist.set_animated(False)
+                canvas.draw()
+                for artist in artists:
+                    artist.set_animated(True)
+                background = canvas.copy_from_bbox(fig.bbox)
+                limits = fig.ax.get_ylim()
+            canvas.restore_region(background)
+            for artist in artists:
+                fig.draw_artist(artist)
+            canvas.blit(fig.bbox)
+        if done:
+            break
+        canvas.flush_events()
+        time.sleep(LivePlot.REFRESH)
+
+    if plt.fignum_exists(fig.number):
+        for artist in artists:
+            artist.set_animated(False)
+        plt.show(block=True) # Leave the final fit up until the window is closed
@@ -0,0 +1,118 @@
+import json
+import struct
+import threading
+import time
+
+MAGIC = b'UWPT'
+VERSION = 1
+TX = 0
+RX = 1
+NOTE = 2 # JSON metadata, not serial traffic
+
+# magic, version, wall clock time at start
+FILE_HEADER = struct.Struct('<4sBd')
+# seconds since start, channel, direction, length
+RECORD_HEADER = struct.Struct('<dBBH')
+
+
+class WireTrace:
+    """Binary capture of raw serial traffic.
+
+    Each record holds the time since the trace was opened, a channel number
+    (the device id for pyrometer boards), the direction and the raw bytes.
+    Nothing is formatted while recording, so tracing is cheap enough to leave
+    on for long runs. Use ``read_trace`` to decode a file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION, time.time()))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def record(self, channel, direction, data):
+        header = RECORD_HEADER.pack(time.monotonic() - self.start,
+                                    channel, direction, len(data))
+        with self.lock:
+            self.file.write(header + bytes(data))
+
+    def note(self, metadata, channel=0):
+        self.record(channel, NOTE, json.dumps(metadata).encode('utf8'))
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+
+class TracedSerial:
+    """Wrap a serial port so every byte moved through it is traced."""
+
+    def __init__(self, port, trace, channel):
+        self.port = port
+        self.trace = trace
+        self.channel = channel
+
+    def __getattr__(self, name):
+        return getattr(self.port, name)
+
+    @property
+    def timeout(self):
+        return self.port.timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        self.port.timeout = timeout
+
+    def write(self, data):
+        self.trace.record(self.channel, TX, data)
+        return self.port.write(data)
+
+    def read(self, size=1):
+        data = self.port.read(size)
+        if data:
+            self.trace.record(self.channel, RX, data)
+        return data
+
+    def read_until(self, *args, **kwargs):
+        data = self.port.read_until(*args, **kwargs)
+        if data:
+            self.trace.record(self.channel, RX, data)
+        return data
+
+    def readline(self, *args, **kwargs):
+        data = self.port.readline(*args, **kwargs)
+        if data:
+            self.trace.record(self.channel, RX, data)
+        return data
+
+
+def read_header(f):
+    magic, version, start_time = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+    if magic != MAGIC:
+        raise ValueError('Not a wire trace file.')
+    if version != VERSION:
+        raise ValueError(f'Unsupported wire trace version {version}.')
+    return start_time
+
+
+def read_trace(path):
+    """Yield (seconds since start, channel, direction, data) records."""
+    with open(path, 'rb') as f:
+        read_header(f)
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            timestamp, channel, direction, size = RECORD_HEADER.unpack(header)
+            data = f.read(size)
+            if len(data) < size:
+                break # Truncated by a crash mid-write
+            yield timestamp, channel, direction, data
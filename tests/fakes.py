@@ -0,0 +1,97 @@
+"""Fakes shared by the tests: a manual clock and a bus of boards."""
+import asyncio
+from uw_pyrometer.pyrometer import PyrometerSerial
+
+
+class FakeClock:
+    """Time only moves when slept through or set."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.now += delay
+
+    async def async_sleep(self, delay):
+        self.now += delay
+        await asyncio.sleep(0)
+
+
+class FakeBus:
+    """Boards sharing a serial port, answering report and pot frames.
+
+    ``signals`` maps device ids to (thermopile, thermistor) signals, or to
+    a function of the time returning them. Readings scale inversely with
+    the board's pots, as on the real amplifiers. With ``echo`` the bus hands
+    back every request, as a half duplex adapter does. ``drop`` replies are
+    lost before the boards answer again.
+    """
+
+    def __init__(self, signals, clock=None, echo=False):
+        self.signals = signals
+        self.clock = clock
+        self.echo = echo
+        self.gains = {i: (20, 20) for i in signals}
+        self.timeout = None
+        self.frames = []
+        self.buffer = bytearray()
+        self.drop = 0
+
+    @property
+    def in_waiting(self):
+        return len(self.buffer)
+
+    def reading(self, device_id):
+        signal = self.signals[device_id]
+        if callable(signal):
+            signal = signal(self.clock.time() if self.clock is not None else 0.0)
+        tp_gain, tr_gain = self.gains[device_id]
+        tp = int(min(max(512 + signal[0] / tp_gain, 0), 1023))
+        tr = int(min(max(signal[1] / tr_gain, 0), 1023))
+        return tp, tr, 512
+
+    def write(self, data):
+        data = bytes(data)
+        self.frames.append(data)
+        if self.echo:
+            self.buffer += data
+        i = 0
+        while i + 3 <= len(data):
+            device_id, cmd = data[i + 1], data[i + 2]
+            ids = list(self.signals) if device_id == 0xFF else [device_id]
+            if cmd == PyrometerSerial.CMD_SET_POT:
+                for board in ids:
+                    if board in self.gains:
+                        self.gains[board] = (data[i + 3], data[i + 4])
+                i += 5
+                continue
+            i += 3
+            if device_id not in self.signals:
+                continue
+            if self.drop:
+                self.drop -= 1
+                continue
+            reply = bytes([PyrometerSerial.SYNC_WORD, device_id, cmd])
+            for value in self.reading(device_id):
+                reply += value.to_bytes(2, 'big')
+            self.buffer += reply
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def read(self, size=1):
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def read_until(self, expected=b'\n', size=None):
+        end = self.buffer.find(expected)
+        end = len(self.buffer) if end < 0 else end + len(expected)
+        return self.read(end)
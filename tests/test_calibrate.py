@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from uw_pyrometer import calibrate, pyrometer
+
+
+def write_run(path, calibration, n=4000):
+    """Blackbody samples with the case warming from 22 to 28 C."""
+    block = np.repeat([30.0, 45.0, 60.0, 75.0], n // 4)
+    curve = pyrometer.thermistor_curve()
+    ratio = np.interp(np.linspace(22.0, 28.0, n), curve[:, 0], curve[:, 1])
+    tr_gain, tp_gain = 40, 100
+    pre_amp = 5.0 / (2.2e6 / (ratio * calibration.r_zero) + 1)
+    tr_v = np.rint(pre_amp * 255 / tr_gain * 1024 / 5) * 5 / 1024
+
+    board = pyrometer.PyrometerSerial.__new__(pyrometer.PyrometerSerial)
+    board.calibration, board.pot_thermistor = calibration, tr_gain
+    case = board.thermistor_temperature(tr_v)
+    power = calibrate.radiance(block) - calibrate.radiance(case) + 3.0
+    tp_v = calibration.tp_resp * power * 255 * 51 / tp_gain + 2.5
+
+    with open(path, 'w', encoding='utf8') as f:
+        f.write('time,tr_v,temp,ref_v,tp_v,power,block_temp,set_point,tp_gain,tr_gain\n')
+        for row in zip(range(n), tr_v, tp_v, block):
+            f.write('{},{:.4f},0,2.5,{:.6f},0,{:.3f},{:.1f},100,40\n'.format(*row, row[3]))
+
+
+def test_recovers_calibration(tmp_path):
+    true = pyrometer.PyrometerCalibration(25000.0, 3.8e-5)
+    write_run(tmp_path / 'run.csv', true)
+
+    fit = calibrate.CalibrationFit()
+    fit.add_file(tmp_path / 'run.csv')
+    result, info = fit.fit()
+    assert info['samples'] == 4000
+    assert result.r_zero == pytest.approx(true.r_zero, rel=1e-3)
+    assert result.tp_resp == pytest.approx(true.tp_resp, rel=1e-3)
+    assert info['background'] == pytest.approx(3.0, abs=0.1)
+
+    result.to_yaml(tmp_path / 'fit.yaml')
+    loaded = pyrometer.PyrometerCalibration.from_yaml(tmp_path / 'fit.yaml')
+    assert loaded.r_zero == pytest.approx(result.r_zero)
+
+
+def test_missing_columns(tmp_path):
+    (tmp_path / 'old.csv').write_text('block_temp,temp,power\n30,25,1.0\n')
+    with pytest.raises(ValueError):
+        calibrate.CalibrationFit().add_file(tmp_path / 'old.csv')
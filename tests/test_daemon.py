@@ -0,0 +1,95 @@
+import os
+import pty
+import time
+import asyncio
+import threading
+import pytest
+from uw_pyrometer.link import LinkDown
+from uw_pyrometer.daemon import AcquisitionDaemon, DaemonClient, RemotePyrometer
+
+
+def board_responder(fd):
+    """Answer report requests for board 4 on the other end of a pty."""
+    while True:
+        try:
+            frame = os.read(fd, 3)
+        except OSError:
+            return
+        if frame == bytes([0x55, 0x04, 0x00]):
+            os.write(fd, bytes([0x55, 0x04, 0x00, 0x0A, 0x1B, 0x2C, 0x3D, 0x4E, 0x5F]))
+
+
+def test_remote_measurement(tmp_path):
+    board_fd, port_fd = pty.openpty()
+    threading.Thread(target=board_responder, args=(board_fd,), daemon=True).start()
+    socket_path = str(tmp_path / 'daemon.sock')
+
+    async def serve():
+        server = AcquisitionDaemon([(os.ttyname(port_fd), 4)])
+        await server.serve(socket_path)
+
+    threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+    for _ in range(100):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.05)
+
+    first = RemotePyrometer(DaemonClient(socket_path), 4)
+    second = RemotePyrometer(DaemonClient(socket_path), 4)
+    assert first.get_measurement() == (0x4E5F, 0x2C3D, 0x0A1B)
+    assert second.get_measurement() == (0x4E5F, 0x2C3D, 0x0A1B)
+    assert first.pot_thermopile is None
+    first.close()
+    second.close()
+
+
+class FakeClient:
+    """Answers a daemon's requests for one board holding gains (30, 12)."""
+
+    def __init__(self):
+        self.requests = []
+        self.settle = 0.0
+        self.failure = None # Error reply to give instead
+
+    def request(self, cmd, **kwargs):
+        self.requests.append(cmd)
+        if self.failure is not None:
+            return DaemonClient.result(self.failure)
+        state = {'board': 4, 'gains': [30, 12], 'settle': self.settle,
+                 'r_zero': 31500.0, 'tp_resp': 3.8e-5, 'curve_scale': 1.0}
+        if cmd == 'measure':
+            return {**state, 'readings': [512, 512, 600]}
+        return state
+
+
+def test_measure_keeps_daemon_gains():
+    from uw_pyrometer.cli.instrument import report_physical
+
+    client = FakeClient()
+    board = RemotePyrometer(client, 4)
+    assert not board.gains_lost and board.worker is None
+    report_physical(board, None, 0.01, 3, 1, False, True, False, False, False)
+    assert (board.pot_thermopile, board.pot_thermistor) == (30, 12)
+    assert set(client.requests) == {'state', 'measure'}
+
+
+def test_remote_flags_daemon_settle():
+    client = FakeClient()
+    board = RemotePyrometer(client, 4)
+    client.settle = 5.0 # The daemon restored gains after a reset
+    board.get_measurement()
+    assert board.settling
+    client.settle = 0.0
+    board.get_measurement()
+    assert not board.settling
+
+
+def test_remote_link_down_is_a_timeout():
+    client = FakeClient()
+    board = RemotePyrometer(client, 4)
+    client.failure = {'ok': False, 'error': 'Board 4 link down', 'type': 'LinkDown'}
+    with pytest.raises(LinkDown):
+        board.get_measurement()
+    client.failure['type'] = 'TimeoutError'
+    with pytest.raises(TimeoutError):
+        board.get_measurement()
@@ -0,0 +1,58 @@
+import serial
+from uw_pyrometer import discover
+from fakes import FakeBus
+
+
+def boards(*ids):
+    return FakeBus({i: (5000, 10240) for i in ids}, echo=True)
+
+
+def test_probe_port_finds_boards():
+    bus = boards(0, 3, 17, 254)
+    found = discover.probe_port(bus)
+    assert sorted(found) == [0, 3, 17, 254]
+    assert found[17] == (512, 512, 762)
+    assert len(bus.frames) == 16 # 255 ids, 16 at a time
+
+
+def test_discover_probes_ports_concurrently(monkeypatch):
+    buses = {'/dev/a': boards(1), '/dev/b': boards(2, 5)}
+    probe = discover.probe_port
+    monkeypatch.setattr(discover, 'probe_port',
+                        lambda path, *args: probe(buses[path], *args))
+    devices, skipped = discover.discover(['/dev/a', '/dev/b'])
+    assert [(d['port'], d['id']) for d in devices] == [('/dev/a', 1), ('/dev/b', 2),
+                                                      ('/dev/b', 5)]
+    assert all(d['responding'] and d['gains'] is None for d in devices)
+    assert skipped == {}
+
+
+class SlowBus(FakeBus):
+    """Replies to a window arrive only once the next window is sent."""
+
+    def __init__(self, signals):
+        super().__init__(signals)
+        self.pending = bytearray()
+
+    def write(self, data):
+        super().write(data)
+        self.buffer, self.pending = self.pending, self.buffer
+        return len(data)
+
+
+def test_probe_port_keeps_late_replies():
+    bus = SlowBus({i: (5000, 10240) for i in (3, 15, 100)})
+    assert sorted(discover.probe_port(bus)) == [3, 15, 100]
+
+
+def test_discover_skips_busy_ports(monkeypatch):
+    def open_port(path, **kwargs):
+        assert kwargs['exclusive']
+        if path == '/dev/busy':
+            raise serial.SerialException('Could not exclusively lock port')
+        return boards(4)
+
+    monkeypatch.setattr(serial, 'Serial', open_port)
+    devices, skipped = discover.discover(['/dev/a', '/dev/busy'])
+    assert [(d['port'], d['id']) for d in devices] == [('/dev/a', 4)]
+    assert list(skipped) == ['/dev/busy']
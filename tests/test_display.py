@@ -0,0 +1,53 @@
+import io
+import time
+from uw_pyrometer.display import LiveDisplay, CLEAR_LINE
+from fakes import FakeClock
+
+
+class Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def test_redraws_in_place():
+    out = Terminal()
+    value = [0]
+    display = LiveDisplay(lambda: [f'value {value[0]}'], stream=out)
+    display.refresh()
+    display.draw()
+    value[0] = 1
+    display.echo('note')
+    display.draw()
+    frames = out.getvalue()
+    assert frames.count('\x1b[1F') == 1 # Back over the one line frame
+    assert f'note{CLEAR_LINE}\nvalue 1{CLEAR_LINE}\n' in frames
+    assert '\x1b[2J' not in frames # Never clears the screen
+
+
+def test_frame_rate_is_independent_of_updates():
+    clock = FakeClock()
+    out = io.StringIO() # Not a terminal, so frames are appended
+    count = [0]
+    display = LiveDisplay(lambda: [f'count {count[0]}'], rate=20, stream=out, clock=clock)
+    assert not display.in_place
+    for _ in range(300): # An update every millisecond for 0.3 s
+        with display.lock:
+            count[0] += 1
+        display.refresh()
+        display.poll()
+        clock.now += 0.001
+    assert display.frames == 6 # One each 0.05 s
+    display.stop()
+    assert display.frames == 7
+    assert out.getvalue().endswith(f'count {count[0]}\n') # Last update drawn on stop
+
+
+def test_redraw_thread():
+    out = io.StringIO()
+    with LiveDisplay(lambda: ['frame'], rate=100, stream=out) as display:
+        display.refresh()
+        for _ in range(500):
+            if display.frames:
+                break
+            time.sleep(0.01)
+        assert display.frames == 1
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import pytest
+import numpy as np
+from uw_pyrometer import emissivity
+from fakes import FakeClock, FakeBus
+
+
+class RampingBlock:
+    """Block heating at 0.1 C/s, sampled until 8 s."""
+
+    def __init__(self, clock, done):
+        self.clock = clock
+        self.done = done
+        self.loop = asyncio.get_running_loop()
+
+    def val(self):
+        assert threading.current_thread() is not threading.main_thread()
+        if self.clock.now >= 8.0:
+            self.loop.call_soon_threadsafe(self.done.set)
+        return 30.0 + 0.1 * self.clock.now
+
+
+def test_block_temps_align_to_samples():
+    clock = FakeClock()
+
+    async def run():
+        done = asyncio.Event()
+        block = RampingBlock(clock, done)
+        return await emissivity.get_block_temps(block, done, clock, interval=2.0)
+
+    times, temps = asyncio.run(run())
+    assert times == [0.0, 2.0, 4.0, 6.0, 8.0, 10.0] # One read after the end
+    aligned = emissivity.align_block_temps([1.0, 5.0, 9.0], times, temps)
+    assert aligned == pytest.approx([30.1, 30.5, 30.9])
+
+
+def test_fit_uncertainty_matches_scatter():
+    rng = np.random.default_rng(1)
+    points = np.repeat(np.arange(5), 50)
+    x = 1e-5 * (1 + points) + 1e-8 * rng.standard_normal(points.size)
+    y = 0.9 * x + 2e-6 + 1e-7 * rng.standard_normal(points.size)
+
+    x_mean, y_mean, x_var, y_var = emissivity.point_means(x, y, points)
+    assert x_var == pytest.approx(np.full(5, 1e-16 / 50), rel=0.5)
+    e, bg, cov = emissivity.fit_uncertainty(x_mean, y_mean, x_var, y_var)
+    assert e == pytest.approx(0.9, abs=5 * np.sqrt(cov[0, 0]))
+    assert bg == pytest.approx(2e-6, abs=5 * np.sqrt(cov[1, 1]))
+
+    # Unweighted standard error of the slope through the five means
+    expected = np.sqrt(1e-14 / 50 / np.sum((x_mean - x_mean.mean())**2))
+    assert np.sqrt(cov[0, 0]) == pytest.approx(expected, rel=0.2)
+
+
+def test_reanalyze_saved_run(tmp_path):
+    measurements = {'block_temp': [30.0, 30.0, 50.0, 50.0, 70.0, 70.0],
+                    'temp': [25.0] * 6,
+                    'power': [1.0, 1.1, 3.0, 3.1, 5.2, 5.1],
+                    'set_point': [30.0, 30.0, 50.0, 50.0, 70.0, 70.0]}
+    path = tmp_path / 'run.csv'
+    e, bg, _ = emissivity.analyze_emissivity(measurements, output=path)
+
+    summary = emissivity.reanalyze(path)
+    assert 'error' not in summary
+    assert (summary['points'], summary['samples']) == (3, 6)
+    assert summary['emissivity'] == pytest.approx(e, rel=1e-3)
+    assert summary['background'] == pytest.approx(1e6 * bg, rel=1e-3)
+    assert 'error' in emissivity.reanalyze(tmp_path / 'missing.csv')
+
+    # A figure that can't be saved keeps the fit
+    summary = emissivity.reanalyze(path, tmp_path / 'missing' / 'run.pdf')
+    assert 'error' not in summary and 'figure_error' in summary
+    assert summary['emissivity'] == pytest.approx(e, rel=1e-3)
+
+
+def test_sample_stops_at_precision():
+    from uw_pyrometer.pyrometer import PyrometerSerial, MEAS_NAMES
+
+    taken = []
+    for spread in (2, 8):
+        rng = np.random.default_rng(3)
+        # ADC noise of the chosen spread around code 600 at the default gains
+        noisy = FakeBus({4: lambda now: (20 * (88 + spread * rng.standard_normal()), 10240)})
+        board = PyrometerSerial(4, noisy, clock=FakeClock())
+        board.pot_thermopile, board.pot_thermistor = 20, 20
+        history = {k: [] for k in MEAS_NAMES}
+        asyncio.run(board.sample(1000, 1.0, history=history, precision={'power': 0.1}))
+        n = len(history['power'])
+        assert 10 <= n < 1000
+        assert np.std(history['power'], ddof=1) / np.sqrt(n) <= 0.1
+        taken.append(n)
+    assert taken[0] < taken[1] # Noisier boards sample longer
+
+
+class SteadyBlock:
+    def __init__(self):
+        self.set_point = None
+
+    def sp(self, val, save, index):
+        self.set_point = val
+
+    def restart(self):
+        pass
+
+    def val(self):
+        return self.set_point
+
+
+class FakePyrometer:
+    """Gives each set point's samples; fails at a chosen set point."""
+
+    def __init__(self, block, fail_at=None, device_id=4):
+        self.id = device_id
+        self.worker = None
+        self.block = block
+        self.fail_at = fail_at
+        self.gain_starts = []
+
+    async def run_io(self, func, *args):
+        return func(*args)
+
+    def auto_gain(self, start=None):
+        self.gain_starts.append(start)
+        self.pot_thermopile, self.pot_thermistor = int(self.block.set_point), 20
+        return self.pot_thermopile, self.pot_thermistor
+
+    async def sample(self, samples, interval, done=None, history=None, precision=None,
+                     track_gains=False):
+        from uw_pyrometer.pyrometer import MEAS_NAMES
+
+        if self.block.set_point == self.fail_at:
+            raise TimeoutError('Packet read timed out')
+        for i in range(samples):
+            for k in MEAS_NAMES:
+                history[k].append(0 if k == 'flags' else float(i))
+            history['power'][-1] = self.id * self.block.set_point / 40
+        await asyncio.sleep(0)
+
+
+def test_resume_from_checkpoint(tmp_path):
+    checkpoint = tmp_path / 'run.checkpoint.json'
+    temps = [30.0, 40.0, 50.0]
+    block = SteadyBlock()
+    with pytest.raises(TimeoutError):
+        asyncio.run(emissivity.run_temps(FakePyrometer(block, fail_at=50.0), block,
+                                         temps, 3, 1.0, clock=FakeClock(),
+                                         checkpoint=checkpoint))
+
+    state = emissivity.load_checkpoint(checkpoint)
+    assert [p['set_point'] for p in state['completed']] == [30.0, 40.0]
+    assert state['completed'][-1]['gains'] == [[40, 20]]
+    assert emissivity.remaining_temps(temps, state) == [50.0]
+
+    tp_dev = FakePyrometer(block)
+    measurements = asyncio.run(emissivity.run_temps(tp_dev, block, temps, 3, 1.0,
+                                                    clock=FakeClock(),
+                                                    checkpoint=checkpoint,
+                                                    resume=state))
+    assert tp_dev.gain_starts == [(40, 20)] # Only the last point, from cached gains
+    assert measurements['set_point'] == [30.0] * 3 + [40.0] * 3 + [50.0] * 3
+    assert measurements['power'][-1] == 5.0
+    assert len(emissivity.load_checkpoint(checkpoint)['completed']) == 3
+
+
+def test_boards_share_the_block():
+    block = SteadyBlock()
+    boards = [FakePyrometer(block, device_id=i) for i in (4, 8)]
+    measurements = asyncio.run(emissivity.run_temps(boards, block, [30.0, 40.0], 3, 1.0,
+                                                    clock=FakeClock()))
+    assert len(measurements) == 2
+    for board, board_measurements in zip(boards, measurements):
+        assert board.gain_starts == [None, (30, 20)]
+        assert board_measurements['set_point'] == [30.0] * 3 + [40.0] * 3
+        assert board_measurements['power'][-1] == board.id
+    assert emissivity.board_output('runs/a.csv', 13) == 'runs/a_13.csv'
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from uw_pyrometer import filters
+
+
+def test_decimate_streams_like_one_block():
+    x = np.random.default_rng(0).standard_normal(1000)
+    for order in (1, 3):
+        whole = filters.Decimate(5, order).process(x)
+        stage = filters.Decimate(5, order)
+        blocks = np.concatenate([stage.process(b) for b in np.array_split(x, 37)])
+        assert blocks == pytest.approx(whole)
+    assert filters.Decimate(4).process(np.arange(8.0)) == pytest.approx([1.5, 5.5])
+
+
+def test_cic_factor_one_passes_blocks_through():
+    stage = filters.parse_stage('cic:1')
+    assert list(stage.process([0.0, 1.0, 2.0])) == [0.0, 1.0, 2.0]
+    assert list(stage.process([3.0, 4.0, 5.0])) == [3.0, 4.0, 5.0]
+    assert list(stage.process([6.0])) == [6.0]
+    assert len(stage.history) == 0
+
+
+def test_median_reject_replaces_glitches():
+    x = np.full(200, 10.0) + 0.01 * np.random.default_rng(1).standard_normal(200)
+    x[[50, 120]] = 1000.0
+    stage = filters.MedianReject(15)
+    out = np.concatenate([stage.process(b) for b in np.array_split(x, 9)])
+    assert stage.rejected >= 2
+    assert out.max() < 11.0
+
+
+def test_kalman_matches_recursion():
+    rng = np.random.default_rng(2)
+    z = np.cumsum(0.03 * rng.standard_normal(500)) + 0.3 * rng.standard_normal(500)
+    stage = filters.Kalman(1e-3, 1e-1)
+    out = np.concatenate([stage.process(b) for b in np.array_split(z, 7)])
+
+    level, variance, expected = z[0], 1e-1, [z[0]]
+    for value in z[1:]:
+        predicted = variance + 1e-3
+        gain = predicted / (predicted + 1e-1)
+        level += gain * (value - level)
+        variance = (1 - gain) * predicted
+        expected.append(level)
+    assert out == pytest.approx(expected)
+
+
+def test_parse_stage():
+    assert filters.parse_stage('cic:8').order == 3
+    assert filters.parse_stage('median:9').window == 9
+    with pytest.raises(ValueError):
+        filters.parse_stage('lowpass')
@@ -0,0 +1,36 @@
+import pytest
+from uw_pyrometer import link
+from fakes import FakeClock
+
+
+def test_timeout_follows_round_trip():
+    timer = link.LinkTimer(4.0, FakeClock())
+    for _ in range(20):
+        timer.success(0.03)
+    assert timer.timeout == pytest.approx(link.MIN_TIMEOUT)
+    for _ in range(20):
+        timer.success(0.5)
+    assert 0.5 < timer.timeout < 1.0
+
+    timer.failure()
+    assert timer.timeout == pytest.approx(2 * 0.5, abs=0.5)
+    for _ in range(10):
+        timer.success(0.5)
+    assert timer.failures == 0
+
+
+def test_breaker_opens_and_probes():
+    clock = FakeClock()
+    timer = link.LinkTimer(0.2, clock)
+    for _ in range(link.BREAKER_FAILURES):
+        timer.check()
+        timer.failure()
+    with pytest.raises(link.LinkDown):
+        timer.check()
+    assert isinstance(link.LinkDown(), TimeoutError)
+
+    clock.now += link.BREAKER_COOLDOWN
+    timer.check() # One probe goes through
+    timer.success(0.05)
+    timer.check()
+    assert timer.failures == 0
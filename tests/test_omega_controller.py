@@ -0,0 +1,34 @@
+from uw_pyrometer import omega_controller, link
+
+
+class Controller:
+    """Answers every command at once, noting the timeout it was read with."""
+
+    def __init__(self):
+        self.timeout = omega_controller.TIMEOUT
+        self.in_waiting = 0
+        self.reply = b''
+        self.read_timeouts = []
+
+    def write(self, data):
+        self.reply = b'X01025.0\r' if data.startswith(b'*X01') else b'G01200064\r'
+
+    def flush(self):
+        pass
+
+    def readline(self):
+        self.read_timeouts.append(self.timeout)
+        reply, self.reply = self.reply, b''
+        return reply
+
+
+def test_fast_reads_keep_other_timeouts():
+    port = Controller()
+    controller = omega_controller.omega_pid(port=port, open_delay=0)
+    for _ in range(20):
+        assert controller.val() == 25.0
+    assert port.read_timeouts[-1] == link.MIN_TIMEOUT
+
+    assert controller.sp() == 10.0
+    assert port.read_timeouts[-1] == omega_controller.TIMEOUT
+    assert port.timeout == omega_controller.TIMEOUT
@@ -0,0 +1,55 @@
+import math
+import numpy as np
+from uw_pyrometer.planner import HeaterModel, plan, predicted_time
+
+
+def synthetic_history(model, temps, start=25.0, step=10.0):
+    times, readings, set_points = [], [], []
+    now, temp = 0.0, start
+    for target in temps:
+        held = 0.0
+        while held < model.settle:
+            times.append(now)
+            readings.append(temp)
+            set_points.append(target)
+            if target > temp + 1.0:
+                temp = min(temp + model.heat_rate * step, target)
+            elif target < temp - 1.0:
+                temp = model.ambient + (temp - model.ambient) * math.exp(-step / model.tau)
+            else:
+                held += step
+            now += step
+    return times, readings, set_points
+
+
+def test_fit_recovers_model():
+    truth = HeaterModel(heat_rate=0.2, tau=1200.0, ambient=20.0, settle=300.0)
+    fitted = HeaterModel.fit(*synthetic_history(truth, [150.0, 60.0, 120.0]))
+    assert np.isclose(fitted.heat_rate, truth.heat_rate, rtol=0.05)
+    assert np.isclose(fitted.tau, truth.tau, rtol=0.05)
+    assert np.isclose(fitted.ambient, truth.ambient, atol=2.0)
+    assert np.isclose(fitted.settle, truth.settle, rtol=0.1)
+
+
+def test_plan_sweeps_up_when_cooling_is_slow():
+    model = HeaterModel(heat_rate=0.5, tau=3600.0)
+    temps = [100.0, 40.0, 160.0, 70.0]
+    order, seconds = plan(temps, model, start=25.0)
+    assert order == sorted(temps)
+    assert seconds == predicted_time(order, model, 25.0)
+    assert seconds < predicted_time(temps, model, 25.0)
+
+
+def test_plan_with_warmup():
+    model = HeaterModel()
+    order, seconds = plan([50.0, 80.0], model, start=25.0, warmup=(100.0, 600.0))
+    assert order == [80.0, 50.0] # Already hot, so cool down through them
+    assert seconds == (model.move_time(25.0, 100.0) + 600.0
+                       + predicted_time(order, model, 100.0))
+    assert seconds == predicted_time(order, model, 25.0, warmup=(100.0, 600.0))
+
+
+def test_cooling_stops_short_of_ambient():
+    model = HeaterModel(ambient=22.0)
+    assert math.isfinite(model.ramp_time(60.0, 22.5)) # Ramp ends at 23.5
+    assert model.ramp_time(60.0, 21.0) == math.inf
@@ -0,0 +1,41 @@
+import os
+import pty
+import asyncio
+import threading
+from uw_pyrometer.portpool import PortPool
+
+
+def paired_responder(fd, device_id, barrier):
+    """Answer report requests only once the other port has a request too."""
+    while True:
+        try:
+            frame = os.read(fd, 3)
+        except OSError:
+            return
+        if frame == bytes([0x55, device_id, 0x00]):
+            try:
+                barrier.wait()
+            except threading.BrokenBarrierError:
+                pass # Still answer, so a failing run ends
+            os.write(fd, bytes([0x55, device_id, 0x00, 0x01, 0x00, 0x02, 0x00, 0x03, 0x00]))
+
+
+def test_ports_run_in_parallel():
+    # One thread for both ports would never have both requests out at once
+    barrier = threading.Barrier(2, timeout=2.0) # Within the read timeout
+    pool = PortPool()
+    for device_id in (1, 2):
+        board_fd, port_fd = pty.openpty()
+        threading.Thread(target=paired_responder, args=(board_fd, device_id, barrier),
+                         daemon=True).start()
+        board = pool.add_board(os.ttyname(port_fd), device_id)
+        board.pot_thermopile, board.pot_thermistor = 20, 20
+
+    async def collect():
+        return [m async for m in pool.stream(0.1, samples=5)]
+
+    readings = asyncio.run(collect())
+    pool.close()
+
+    assert not barrier.broken
+    assert sorted(m['board'] for m in readings) == [1] * 5 + [2] * 5
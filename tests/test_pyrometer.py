@@ -1,7 +1,10 @@
 import pty
 import os
 import pytest
-from uw_pyrometer.pyrometer import PyrometerSerial
+import numpy as np
+from uw_pyrometer.pyrometer import PyrometerSerial, RESET_TIMEOUTS
+from uw_pyrometer.wiretrace import WireTrace, read_trace, TX
+from fakes import FakeClock, FakeBus
 
 
 @pytest.fixture(scope="function")
@@ -56,3 +59,151 @@ def test_read_power(serial_simulator):
 
     assert power_0 == pytest.approx(100.0, .01)
     assert power_1 == pytest.approx(25.0, .01)
+
+
+def test_wire_trace(serial_simulator, tmp_path):
+    mock_serial, put_data = serial_simulator
+    trace_path = tmp_path / 'trace.bin'
+    with WireTrace(trace_path) as trace:
+        device = PyrometerSerial(4, mock_serial, trace=trace)
+        device.send(bytes([PyrometerSerial.CMD_REPORT]))
+
+    records = list(read_trace(trace_path))
+    assert len(records) == 1
+    _, channel, direction, data = records[0]
+    assert channel == 4
+    assert direction == TX
+    assert data == bytes([0x55, 0x04, 0x00])
+
+
+def test_gains_restored_after_reset():
+    clock = FakeClock()
+    port = FakeBus({4: (5000, 10000)}, clock)
+    device = PyrometerSerial(4, port, clock=clock)
+    device.set_gains(24, 15)
+    port.drop = 1 # A single lost reply is just noise
+    with pytest.raises(TimeoutError):
+        device.get_measurement()
+    device.get_measurement()
+    assert port.frames[-1] == bytes([0x55, 0x04, 0x00])
+
+    port.drop = RESET_TIMEOUTS
+    for _ in range(RESET_TIMEOUTS):
+        with pytest.raises(TimeoutError):
+            device.get_measurement()
+    assert (device.pot_thermopile, device.pot_thermistor) == (24, 15)
+
+    port.frames.clear()
+    device.get_measurement()
+    assert port.frames[-1] == bytes([0x55, 0x04, 0x01, 24, 15])
+    assert device.settling
+    device.thermistor_temperature(2.0) # Still converts while settling
+    clock.now += PyrometerSerial.GAIN_SETTLE_TIME
+    assert not device.settling
+
+
+@pytest.mark.parametrize('track', [False, True])
+def test_gain_tracking(track):
+    import asyncio
+    from uw_pyrometer.pyrometer import MEAS_NAMES, FLAG_SETTLING
+
+    clock = FakeClock()
+    # Thermopile signal growing until a fixed gain would saturate
+    board = FakeBus({4: lambda now: (4000 * (1 + now / 50), 10240)}, clock)
+    device = PyrometerSerial(4, board, clock=clock)
+    device.set_gains(20, 20)
+    clock.now = 0.0
+    history = {k: [] for k in MEAS_NAMES}
+    asyncio.run(device.sample(200, 1.0, history=history, track_gains=track))
+
+    tp_v = np.array(history['tp_v'])
+    gains = np.array(history['tp_gain'])
+    saturated = tp_v >= device.adc_to_voltage(1023)
+    if not track:
+        assert saturated.sum() > 50
+        assert np.all(gains == 20)
+        return
+    assert not saturated.any()
+    assert np.all(np.diff(gains) >= 0) and gains[-1] > 40
+    assert np.all(np.diff(gains) <= max(1, round(gains.max() / 8)))
+    changed = np.flatnonzero(np.diff(gains)) + 1
+    assert np.all(np.array(history['flags'])[changed] & FLAG_SETTLING)
+    # Each sample converts with its own gain, so power follows the signal
+    power = np.array(history['power'])
+    assert np.all(np.diff(power[np.array(history['flags']) == 0]) > 0)
+
+
+def test_sample_without_count_runs_until_complete():
+    import asyncio
+
+    clock = FakeClock()
+    device = PyrometerSerial(4, FakeBus({4: (5000, 10240)}, clock), clock=clock)
+    device.set_gains(20, 20)
+    times = []
+
+    async def run():
+        complete = asyncio.Event()
+
+        def update(measurement):
+            times.append(measurement['time'])
+            if len(times) == 30:
+                complete.set()
+        await device.sample(None, 1.0, complete, update)
+    asyncio.run(run())
+    assert len(times) == 30
+
+
+def test_settling_samples_not_counted():
+    import asyncio
+    from uw_pyrometer.pyrometer import MEAS_NAMES
+
+    clock = FakeClock()
+    device = PyrometerSerial(4, FakeBus({4: (5000, 10240)}, clock), clock=clock)
+    device.set_gains(20, 20)
+    device.settle_until = clock.now + 3.0
+    history = {k: [] for k in MEAS_NAMES}
+    asyncio.run(device.sample(5, 1.0, history=history))
+    assert history['flags'] == [1, 1, 1, 0, 0, 0, 0, 0]
+
+
+def test_sample_filters_in_blocks():
+    import asyncio
+    from uw_pyrometer.filters import Decimate
+
+    clock = FakeClock()
+    device = PyrometerSerial(4, FakeBus({4: (5000, 10240)}, clock), clock=clock)
+    device.set_gains(20, 20)
+    blocks = []
+    means = asyncio.run(device.sample(20, 1.0, filters={'power': Decimate(4)},
+                                      filter_block=8, filtered_f=blocks.append))
+    assert [len(block['power']) for block in blocks] == [2, 2, 1] # Last on stopping
+    assert means['power'] == pytest.approx(blocks[0]['power'][0])
+
+
+def test_fleet_auto_gain_shares_settles():
+    from uw_pyrometer.pyrometer import fleet_auto_gain
+
+    signals = {i: (5000 + 1500 * i, 12000 + 900 * i) for i in range(1, 9)}
+    clock = FakeClock()
+    bus = FakeBus(signals)
+    boards = [PyrometerSerial(i, bus, clock=clock) for i in signals]
+    gains = fleet_auto_gain(boards)
+    fleet_time = clock.now
+
+    clock.now = 0.0
+    alone = [PyrometerSerial(i, FakeBus(signals), clock=clock).auto_gain() for i in signals]
+    assert gains == alone # Same search, only the waits are shared
+    assert fleet_time < clock.now / 4
+    for board, (tp_gain, tr_gain) in zip(boards, gains):
+        assert (board.pot_thermopile, board.pot_thermistor) == (tp_gain, tr_gain)
+        assert bus.gains[board.id] == (tp_gain, tr_gain)
+
+
+def test_fleet_auto_gain_broadcasts_shared_trials():
+    from uw_pyrometer.pyrometer import fleet_auto_gain
+
+    bus = FakeBus({i: (5000, 10000) for i in (1, 2, 3)})
+    boards = [PyrometerSerial(i, bus, clock=FakeClock()) for i in (1, 2, 3)]
+    fleet_auto_gain(boards, broadcast=True)
+    set_pot = [f for f in bus.frames if f[2] == PyrometerSerial.CMD_SET_POT]
+    assert set_pot and all(f[1] == 0xFF for f in set_pot)
@@ -0,0 +1,63 @@
+import os
+import pytest
+from uw_pyrometer import pyrometer
+from uw_pyrometer.registry import CalibrationRegistry
+from fakes import FakeClock
+
+
+def write(path, r_zero, board=''):
+    path.write_text(board + f'thermistor:\n  room_temp: {r_zero}\n'
+                    'thermopile:\n  responsivity: 3.8e-5\n')
+
+
+def test_registry_lookup_and_reload(tmp_path):
+    write(tmp_path / 'd.yaml', 31500, 'board:\n  id: 13\n  serial: A10K3Z\n')
+    clock = FakeClock()
+    registry = CalibrationRegistry(tmp_path, clock=clock)
+
+    first = registry.get(13)
+    assert first.r_zero == 31500
+    assert registry.get('A10K3Z') is first
+    assert registry.get('d') is first
+    assert registry.get(14) is pyrometer.default_calibration()
+    with pytest.raises(AttributeError):
+        first.r_zero = 1.0
+
+    write(tmp_path / 'd.yaml', 32000, 'board:\n  id: [13, 14]\n')
+    os.utime(tmp_path / 'd.yaml', ns=(0, 10**9)) # Make sure the mtime moves
+    assert registry.get(13) is first # Not checked again yet
+    clock.now += CalibrationRegistry.CHECK_INTERVAL
+    assert registry.get(13).r_zero == 32000
+    assert registry.get(14) is registry.get(13)
+    assert 'A10K3Z' not in registry
+
+    (tmp_path / 'd.yaml').write_text('thermistor: [')
+    os.utime(tmp_path / 'd.yaml', ns=(0, 2 * 10**9))
+    clock.now += CalibrationRegistry.CHECK_INTERVAL
+    assert registry.get(13).r_zero == 32000 # Keeps the last good file
+
+
+def test_id_from_file_name(tmp_path):
+    pyrometer.PyrometerCalibration(25000.0, 3.8e-5).to_yaml(tmp_path / '7.yaml')
+    pyrometer.PyrometerCalibration(26000.0, 3.8e-5).to_yaml(tmp_path / 'spare.yaml', 9)
+    registry = CalibrationRegistry(tmp_path)
+    assert registry.get(7).r_zero == 25000.0
+    assert registry.get(9).r_zero == 26000.0
+    assert '7' not in registry
+
+
+def test_calibration_pickles_and_copies():
+    import copy
+    import pickle
+
+    calibration = pyrometer.PyrometerCalibration(25000.0, 3.8e-5, 1.02)
+    for clone in (pickle.loads(pickle.dumps(calibration)), copy.deepcopy(calibration),
+                  copy.copy(calibration)):
+        assert repr(clone) == repr(calibration)
+        with pytest.raises(AttributeError):
+            clone.r_zero = 1.0
+
+
+def test_boards_share_default():
+    boards = [pyrometer.PyrometerSerial(i, None) for i in range(2)]
+    assert boards[0].calibration is boards[1].calibration
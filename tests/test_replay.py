@@ -0,0 +1,26 @@
+from uw_pyrometer.replay import ReplaySession, replay_pyrometer
+from uw_pyrometer.wiretrace import WireTrace, TX, RX
+
+REPORT = bytes([0x55, 0x04, 0x00])
+
+
+def make_trace(path, replies):
+    with WireTrace(path) as trace:
+        trace.note({'device_id': 4})
+        for reply in replies:
+            trace.record(4, TX, REPORT)
+            trace.record(4, RX, bytes([0x55, 0x04, 0x00]) + reply)
+
+
+def test_replay_measurement(tmp_path):
+    trace_path = tmp_path / 'session.trace'
+    make_trace(trace_path, [bytes([0x0A, 0x1B, 0x2C, 0x3D, 0x4E, 0x5F]),
+                            bytes([0x01, 0x02, 0x03, 0x04, 0x01, 0x00])])
+    session = ReplaySession(trace_path)
+    assert session.metadata == {'device_id': 4}
+
+    device = replay_pyrometer(session, 4)
+    assert device.get_measurement() == (0x4E5F, 0x2C3D, 0x0A1B)
+    assert device.get_measurement() == (0x0100, 0x0304, 0x0102)
+    # Polls beyond the recording repeat the last reply
+    assert device.get_measurement() == (0x0100, 0x0304, 0x0102)
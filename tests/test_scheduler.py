@@ -0,0 +1,31 @@
+import asyncio
+from uw_pyrometer.scheduler import FixedRateScheduler
+from fakes import FakeClock
+
+
+def test_deadlines_ignore_latency():
+    clock = FakeClock(100.0)
+    scheduler = FixedRateScheduler(0.2, clock)
+    fired = []
+    for latency in [0.05, 0.15, 0.0, 0.1]:
+        scheduler.wait_sync()
+        fired.append(clock.now)
+        clock.now += latency # Time spent acquiring
+    assert [round(t - 100.0, 6) for t in fired] == [0.0, 0.2, 0.4, 0.6]
+    assert scheduler.missed == 0
+
+
+def test_missed_deadlines_are_skipped():
+    clock = FakeClock(100.0)
+    scheduler = FixedRateScheduler(0.2, clock)
+
+    async def run():
+        await scheduler.wait()
+        clock.now += 0.5 # A slow read
+        await scheduler.wait()
+        return clock.now
+
+    assert round(asyncio.run(run()) - 100.0, 6) == 0.5
+    assert scheduler.missed == 1
+    scheduler.wait_sync()
+    assert round(clock.now - 100.0, 6) == 0.6
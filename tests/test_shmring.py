@@ -0,0 +1,49 @@
+import numpy as np
+from uw_pyrometer.shmring import SampleRing, RingReader
+
+
+def test_ring_fan_out_and_overrun():
+    ring = SampleRing.create(capacity=4)
+    attached = SampleRing.attach(ring.name)
+    try:
+        fast = RingReader(attached)
+        slow = RingReader(attached)
+        for n in range(3):
+            ring.publish(time=float(n), board=4, temp=20.0 + n)
+        assert list(fast.poll()['temp']) == [20.0, 21.0, 22.0]
+
+        for n in range(3, 9):
+            ring.publish(time=float(n), board=4, temp=20.0 + n)
+        assert list(fast.poll()['seq']) == [5, 6, 7, 8]
+        assert fast.lost == 2
+        assert list(slow.poll()['seq']) == [5, 6, 7, 8]
+        assert slow.lost == 5
+        assert len(slow.poll()) == 0
+    finally:
+        attached.close()
+        ring.close()
+
+
+def test_poll_drops_records_rewritten_during_copy(monkeypatch):
+    ring = SampleRing.create(capacity=4)
+    try:
+        reader = RingReader(ring)
+        for n in range(2):
+            ring.publish(time=float(n), temp=20.0 + n)
+        records = ring.records
+
+        class Racing:
+            """The writer reuses slot 1 just after the reader copies it."""
+
+            def __getitem__(self, key):
+                copy = records[key]
+                if not isinstance(key, str):
+                    records[1]['seq'] = np.iinfo(np.uint64).max
+                return copy
+
+        monkeypatch.setattr(ring, 'records', Racing())
+        assert list(reader.poll()['seq']) == [0]
+        assert reader.lost == 1
+    finally:
+        monkeypatch.undo()
+        ring.close()
@@ -0,0 +1,29 @@
+import random
+import statistics
+import pytest
+from uw_pyrometer.stats import RollingStats
+
+
+def test_rolling_window():
+    rng = random.Random(0)
+    values = [rng.gauss(10.0, 2.0) for _ in range(200)]
+    stats = RollingStats(16, median=True)
+    for n, value in enumerate(values, 1):
+        stats.add(value)
+        window = values[max(0, n-16):n]
+        assert stats.count == len(window)
+        assert stats.mean == pytest.approx(statistics.mean(window))
+        assert stats.min == min(window)
+        assert stats.max == max(window)
+        assert stats.median == pytest.approx(statistics.median(window))
+        if n > 1:
+            assert stats.std == pytest.approx(statistics.stdev(window))
+
+
+def test_unbounded():
+    stats = RollingStats()
+    stats.extend([3.0, 1.0, 4.0, 1.0, 5.0])
+    assert stats.count == 5
+    assert stats.mean == pytest.approx(2.8)
+    assert (stats.min, stats.max) == (1.0, 5.0)
+    assert stats.sem == pytest.approx(statistics.stdev([3, 1, 4, 1, 5]) / 5**0.5)
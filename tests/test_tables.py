@@ -0,0 +1,23 @@
+import pytest
+from uw_pyrometer import tables
+
+
+def test_cache_keyed_on_skipped_rows(tmp_path, monkeypatch):
+    (tmp_path / 'steps.csv').write_text('0,1\n1,2\n2,4\n')
+    monkeypatch.setattr(tables, 'DATA_DIR', tmp_path)
+    monkeypatch.setattr(tables, 'CACHE_DIR', tmp_path / 'cache')
+    load = tables.load_table.__wrapped__ # Past the in-process cache
+    assert load('steps').shape == (3, 2)
+    assert load('steps', skip_header=1).shape == (2, 2)
+    assert load('steps').shape == (3, 2)
+    assert len(list((tmp_path / 'cache').glob('*.npy'))) == 2
+
+
+def test_shared_table_is_read_only(tmp_path, monkeypatch):
+    (tmp_path / 'steps.csv').write_text('0,1\n1,2\n')
+    monkeypatch.setattr(tables, 'DATA_DIR', tmp_path)
+    monkeypatch.setattr(tables, 'CACHE_DIR', tmp_path / 'cache')
+    load = tables.load_table.__wrapped__
+    for table in (load('steps'), load('steps')): # Parsed, then from the cache
+        with pytest.raises(ValueError):
+            table[0, 0] = 5.0
@@ -0,0 +1,25 @@
+import queue
+import multiprocessing
+import matplotlib
+matplotlib.use('Agg')
+from uw_pyrometer import vis
+
+
+def test_final_fit_drawn_with_end(monkeypatch):
+    drawn = []
+    monkeypatch.setattr(vis.EmissivityVis, 'update_emissivity',
+                        lambda self, x, y, bg, e, cov=None: drawn.append(e))
+    monkeypatch.setattr(vis.plt, 'show', lambda block=True: None)
+    updates = queue.Queue()
+    for e in (0.8, 0.9, None): # The last fit and the end in one drain
+        updates.put(None if e is None else ([], [], 0.0, e))
+    vis.live_plot_loop(updates, None)
+    assert drawn == [0.9]
+
+
+def test_newest_update_replaces_oldest():
+    plot = vis.LivePlot.__new__(vis.LivePlot) # No plot process
+    plot.queue = multiprocessing.get_context('spawn').Queue(maxsize=2)
+    for n in range(5):
+        plot.put_latest(n)
+    assert [plot.queue.get(timeout=1) for _ in range(2)] == [3, 4]